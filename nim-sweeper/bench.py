@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from typing import List
+
+import z3
+
+import nimsweeper as ns
+
+
+# ------------------ SUITE DEFAULTS -------------------- #
+SIZES = [(8, 8), (9, 9), (16, 16), (16, 30), (30, 30)]
+DENSITIES = [0.10, 0.15, 0.20]
+# (blanks_no_adj, constrain_mines, limit_sols) combinations for solve()
+SOLVE_FLAGS = list(itertools.product([False, True], repeat=3))
+SOLVE_TIMEOUT = 5.0
+
+
+# -------------- BOARD SAMPLING ---------------- #
+
+def sample_boards(rows: int, cols: int, mine_cnt: int, count: int,
+                  hide: float, seed: int) -> List[List[List[int]]]:
+    """
+    Generates count seeded boards, hiding each number with probability hide
+    so the solver has more than one solution to enumerate.
+    """
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        with contextlib.redirect_stdout(io.StringIO()):
+            board = ns.generate_board(rows, cols, mine_cnt, rng)
+        for row in board:
+            for j in range(cols):
+                if rng.random() < hide:
+                    row[j] = ns.UNKNOWN
+        boards.append(board)
+    return boards
+
+
+# -------------- ENCODINGS ---------------- #
+
+def compare_encodings(rows: int = 9, cols: int = 9, mine_cnt: int = 25,
+                      count: int = 5, hide: float = 0.6, seed: int = 0):
+    """
+    Times the model-enumeration loop of solve() under every encoding on the same boards
+    """
+    boards = sample_boards(rows, cols, mine_cnt, count, hide, seed)
+    results = {}
+    for name in ns.ENCODINGS:
+        elapsed = 0
+        num_sols = []
+        for board in boards:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                num, _ = ns.solve(board, mine_cnt,
+                                  blanks_no_adj=False,
+                                  constrain_mines=True,
+                                  limit_sols=True,
+                                  encoding=name)
+                elapsed += time.perf_counter() - start
+            num_sols.append(num)
+        results[name] = (elapsed, num_sols)
+        print(f"{name:>5}: {elapsed:8.3f}s  solutions: {num_sols}")
+    return results
+
+
+# -------------- SPARSE ENCODING ---------------- #
+
+def check_sparse(rows: int = 5, cols: int = 5, mine_cnt: int = 5,
+                 count: int = 40, hide: float = 0.3, seed: int = 0) -> int:
+    """
+    Checks that the sparse (frontier-only) and dense encodings of solve() find the same
+    set of solutions on seeded boards, for every (blanks_no_adj, constrain_mines)
+    combination under every encoding. Prints each mismatch and returns how many there were.
+    """
+    boards = sample_boards(rows, cols, mine_cnt, count, hide, seed)
+    checked = mismatches = 0
+    for name in ns.ENCODINGS:
+        for blanks_no_adj, constrain_mines in itertools.product([False, True], repeat=2):
+            for n, board in enumerate(boards):
+                found = {}
+                for sparse in (False, True):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        _, sols = ns.solve(board, mine_cnt, blanks_no_adj, constrain_mines,
+                                           limit_sols=False, encoding=name, sparse=sparse)
+                    found[sparse] = set(sols)
+                checked += 1
+                if found[False] != found[True]:
+                    mismatches += 1
+                    print(f"board {n} ({name}, blanks_no_adj={int(blanks_no_adj)}, "
+                          f"constrain={int(constrain_mines)}): {len(found[False])} dense "
+                          f"vs {len(found[True])} sparse solutions")
+    print(f"sparse: {checked - mismatches} of {checked} solution sets match the dense encoding")
+    return mismatches
+
+
+# -------------- MEASUREMENT ---------------- #
+
+def measure(fn, *args, stats: ns.SolveStats = None, **kwargs) -> dict:
+    """
+    Runs fn twice: once for wall time (filling stats, if given, for the solver
+    functions that take them), then once under tracemalloc for peak Python memory,
+    so neither the tracing nor the instrumentation skews the other's numbers.
+    Returns the measurements together with the result of the timed run.
+    """
+    timed_kwargs = kwargs if stats is None else dict(kwargs, stats=stats)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn(*args, **timed_kwargs)
+        elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = stats or ns.SolveStats()
+    return {"seconds": elapsed, "peak_bytes": peak, "result": result, "stats": stats}
+
+
+# -------------- SUITE ---------------- #
+
+def bench_case(rows: int, cols: int, density: float, count: int, hide: float,
+               seed: int, timeout: float = SOLVE_TIMEOUT) -> List[dict]:
+    """
+    Benchmarks generate_board, every solve() flag combination, likely_mines and
+    likely_safe on one board size and mine density
+    """
+    mine_cnt = max(1, int(rows * cols * density))
+    case = {"rows": rows, "cols": cols, "mine_cnt": mine_cnt, "boards": count}
+    records = []
+
+    def record(name, runs, solutions=None, **extra):
+        entry = dict(case, name=name, **extra)
+        entry["seconds"] = sum(run["seconds"] for run in runs)
+        entry["peak_bytes"] = max(run["peak_bytes"] for run in runs)
+        entry["checks"] = sum(run["stats"].calls.get("check", 0) for run in runs)
+        for key in ("conflicts", "decisions"):
+            entry[key] = sum(run["stats"].z3.get(key, 0) for run in runs)
+        entry["phases"] = {}
+        for run in runs:
+            for phase, seconds in run["stats"].phases.items():
+                entry["phases"][phase] = entry["phases"].get(phase, 0) + seconds
+        if solutions is not None:
+            entry["solutions"] = solutions
+            entry["solutions_per_second"] = solutions / entry["seconds"] if entry["seconds"] else 0
+        records.append(entry)
+        print(f"{name:<40} {rows:>3}x{cols:<3} {mine_cnt:>4} mines  "
+              f"{entry['seconds']:8.3f}s  {entry['checks']:>6} checks  "
+              f"{entry['peak_bytes'] / 1024:10.1f} KiB")
+
+    rng = random.Random(seed)
+    record("generate_board", [measure(ns.generate_board, rows, cols, mine_cnt, rng)
+                              for _ in range(count)])
+    boards = sample_boards(rows, cols, mine_cnt, count, hide, seed)
+
+    for blanks_no_adj, constrain_mines, limit_sols in SOLVE_FLAGS:
+        runs = [measure(ns.solve, board, mine_cnt, blanks_no_adj, constrain_mines,
+                        limit_sols, timeout=timeout, stats=ns.SolveStats())
+                for board in boards]
+        name = (f"solve(blanks_no_adj={int(blanks_no_adj)},"
+                f"constrain={int(constrain_mines)},limit={int(limit_sols)})")
+        record(name, runs, solutions=sum(run["result"][0] for run in runs),
+               blanks_no_adj=blanks_no_adj, constrain_mines=constrain_mines,
+               limit_sols=limit_sols)
+
+        if (blanks_no_adj, constrain_mines, limit_sols) == (False, True, True):
+            pairs = [(run["result"][1], board) for run, board in zip(runs, boards)
+                     if run["result"][1]]
+            record("likely_mines", [measure(ns.likely_mines, sols, board)
+                                    for sols, board in pairs] or [measure(list)])
+            record("likely_safe", [measure(ns.likely_safe, sols, board)
+                                   for sols, board in pairs] or [measure(list)])
+    return records
+
+
+def run_suite(sizes=SIZES, densities=DENSITIES, count: int = 2, hide: float = 0.6,
+              seed: int = 0, timeout: float = SOLVE_TIMEOUT) -> dict:
+    """
+    Sweeps every board size and mine density and returns the JSON-ready report
+    """
+    records = []
+    for (rows, cols), density in itertools.product(sizes, densities):
+        records += bench_case(rows, cols, density, count, hide, seed, timeout)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "z3": z3.get_version_string(),
+        "seed": seed,
+        "hide": hide,
+        "timeout": timeout,
+        "results": records,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_reports(old: dict, new: dict):
+    """
+    Prints the time ratio new / old for every benchmark present in both reports
+    """
+    def key(entry):
+        return (entry["name"], entry["rows"], entry["cols"], entry["mine_cnt"])
+
+    before = {key(entry): entry for entry in old["results"]}
+    print(f"comparing {old.get('commit')} -> {new.get('commit')}")
+    for entry in new["results"]:
+        if key(entry) not in before or not before[key(entry)]["seconds"]:
+            continue
+        ratio = entry["seconds"] / before[key(entry)]["seconds"]
+        flag = "  SLOWER" if ratio > 1.2 else ""
+        print(f"{entry['name']:<40} {entry['rows']:>3}x{entry['cols']:<3} "
+              f"{entry['mine_cnt']:>4} mines  x{ratio:6.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("NIMSWEEPER BENCH", "Time the solver on seeded boards.")
+
+    parser.add_argument("--sizes", default=None,
+                        help="Board sizes to sweep, e.g. 8x8,16x30 (defaults to 8x8 up to 30x30).")
+    parser.add_argument("--densities", default=None,
+                        help="Mine densities to sweep, e.g. 0.1,0.2.")
+    parser.add_argument("-n", "--boards", default=2, type=int,
+                        help="Number of boards per size and density.")
+    parser.add_argument("--hide", default=0.6, type=float,
+                        help="Probability that a number is hidden from the solver.")
+    parser.add_argument("-s", "--seed", default=0, type=int,
+                        help="Seed for board generation.")
+    parser.add_argument("--timeout", default=SOLVE_TIMEOUT, type=float,
+                        help="Seconds allowed per solve() call.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the JSON report to this file.")
+    parser.add_argument("--compare", default=None,
+                        help="Compare against a JSON report saved from an earlier commit.")
+    parser.add_argument("--encodings", action='store_true',
+                        help="Only compare the solver encodings on 9x9 boards with 25 mines.")
+    parser.add_argument("--sparse", action='store_true',
+                        help="Only check that the sparse and dense encodings find the same "
+                             "solutions on 40 seeded 5x5 boards with 5 mines.")
+
+    args = parser.parse_args()
+    if args.encodings:
+        compare_encodings(count=args.boards, hide=args.hide, seed=args.seed)
+    elif args.sparse:
+        if check_sparse(seed=args.seed):
+            raise SystemExit(1)
+    else:
+        sizes = SIZES if args.sizes is None else \
+            [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+        densities = DENSITIES if args.densities is None else \
+            [float(d) for d in args.densities.split(",")]
+        report = run_suite(sizes, densities, args.boards, args.hide, args.seed, args.timeout)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                compare_reports(json.load(f), report)
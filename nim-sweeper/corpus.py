@@ -0,0 +1,248 @@
+import mmap
+import os
+import struct
+from typing import List, Tuple
+
+import nimsweeper as ns
+
+
+# ------------------ FORMAT -------------------- #
+# A corpus file is a 32-byte header followed by fixed-width records, so record k
+# starts at HEADER_SIZE + k * record_size and nothing needs parsing to find it.
+#
+# header: magic, version, kind, rows, cols, mine_cnt, record_size (little-endian)
+# record: the cells, two per byte (high nibble first), each stored as value + 2 so
+#         MINE -> 0, UNKNOWN -> 1 and the numbers 0..8 -> 2..10; an odd cell count
+#         pads the last low nibble with 0xF.
+#         RESULTS records add the solution count (u64, saturated) and every cell's
+#         mine probability as a byte (0 = safe, 255 = mine).
+
+MAGIC = b"NSWP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHII")
+HEADER_SIZE = 32
+COUNT = struct.Struct("<Q")
+
+BOARDS = 0  # fully revealed boards, with MINE cells, as generate_truth() returns them
+STATES = 1  # partial game states, with UNKNOWN cells
+RESULTS = 2  # game states with their solution count and mine probabilities
+KINDS = {BOARDS: "boards", STATES: "states", RESULTS: "results"}
+
+CODE_OFFSET = 2  # code = value - MINE
+PAD = 0xF
+
+_HIGH = bytes(code << 4 for code in range(16)) + bytes(240)
+_HIGH_NIBBLE = bytes(byte >> 4 for byte in range(256))
+_LOW_NIBBLE = bytes(byte & 0xF for byte in range(256))
+
+
+def cell_bytes(rows: int, cols: int) -> int:
+    return (rows * cols + 1) // 2
+
+
+def record_size(kind: int, rows: int, cols: int) -> int:
+    """
+    Returns the width in bytes of one record of the given kind
+    """
+    size = cell_bytes(rows, cols)
+    if kind == RESULTS:
+        size += COUNT.size + rows * cols
+    return size
+
+
+# -------------- CELL PACKING ---------------- #
+
+def pack_cells(board: List[List[int]]) -> bytes:
+    """
+    Packs a board's cells into 4-bit codes, two per byte
+    """
+    codes = bytes(value + CODE_OFFSET for row in board for value in row)
+    if len(codes) % 2:
+        codes += bytes([PAD])
+    return bytes(map(int.__or__, codes[0::2].translate(_HIGH), codes[1::2]))
+
+
+def unpack_cells(data: bytes, rows: int, cols: int) -> List[List[int]]:
+    """
+    Unpacks 4-bit cell codes back into a board
+    """
+    codes = bytearray(2 * len(data))
+    codes[0::2] = data.translate(_HIGH_NIBBLE)
+    codes[1::2] = data.translate(_LOW_NIBBLE)
+    return [[code - CODE_OFFSET for code in codes[i * cols:(i + 1) * cols]]
+            for i in range(rows)]
+
+
+# -------------- WRITING ---------------- #
+
+class CorpusWriter:
+    """
+    Streams records into a corpus file, appending to it if it already exists with
+    the same kind and board shape. Use as a context manager, or call close().
+    """
+
+    def __init__(self, path: str, kind: int, rows: int, cols: int,
+                 mine_cnt: int = ns.MINE_CNT, buffering: int = 1 << 20):
+        self.kind = kind
+        self.rows = rows
+        self.cols = cols
+        self.mine_cnt = mine_cnt
+        self.record_size = record_size(kind, rows, cols)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with CorpusReader(path) as existing:
+                if (existing.kind, existing.rows, existing.cols, existing.mine_cnt) != \
+                        (kind, rows, cols, mine_cnt):
+                    raise ValueError(f"{path} holds a different kind of corpus")
+                count = existing.count
+            # drop a record cut short by an interrupted writer, or every record
+            # appended after it would be read back shifted
+            self.file = open(path, "r+b", buffering=buffering)
+            self.file.truncate(HEADER_SIZE + count * self.record_size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, "wb", buffering=buffering)
+            header = HEADER.pack(MAGIC, VERSION, kind, rows, cols, mine_cnt, self.record_size)
+            self.file.write(header.ljust(HEADER_SIZE, b"\0"))
+        self.count = 0
+
+    def write(self, board: List[List[int]], solutions: int = 0,
+              probs: List[List[float]] = None):
+        """
+        Appends one record. RESULTS corpora also take the board's solution count and
+        its mine probabilities (see mine_probabilities()), which they require: there is
+        no byte left to mark them as missing, and zeros would read back as all safe.
+        """
+        if len(board) != self.rows or len(board[0]) != self.cols:
+            raise ValueError(f"expected a {self.rows}x{self.cols} board")
+        record = pack_cells(board)
+        if self.kind == RESULTS:
+            if probs is None:
+                raise ValueError("a results record needs the board's mine probabilities")
+            record += COUNT.pack(min(solutions, 2 ** 64 - 1))
+            record += bytes(round(p * 255) for row in probs for p in row)
+        self.file.write(record)
+        self.count += 1
+
+    def write_many(self, records):
+        """
+        Appends every record: boards, or for RESULTS corpora (board, solution count,
+        mine probabilities) tuples as write() takes them
+        """
+        for record in records:
+            if self.kind == RESULTS:
+                self.write(*record)
+            else:
+                self.write(record)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -------------- READING ---------------- #
+
+class CorpusReader:
+    """
+    Random access to a corpus through a read-only memory map: len(), indexing and
+    iteration decode one record at a time, and nothing is read until it is used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER_SIZE:
+            raise ValueError(f"{path} is not a corpus file")
+        magic, version, kind, rows, cols, mine_cnt, size = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a corpus file")
+        if version != VERSION:
+            raise ValueError(f"{path} has corpus version {version}, expected {VERSION}")
+        self.kind = kind
+        self.rows = rows
+        self.cols = cols
+        self.mine_cnt = mine_cnt
+        self.record_size = size
+        self.cell_bytes = cell_bytes(rows, cols)
+        # a record cut short by an interrupted writer is ignored
+        self.count = (len(self.mm) - HEADER_SIZE) // size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, k: int) -> memoryview:
+        """
+        Returns the raw bytes of record k, without copying
+        """
+        if not -self.count <= k < self.count:
+            raise IndexError("corpus record out of range")
+        start = HEADER_SIZE + (k % self.count) * self.record_size
+        return memoryview(self.mm)[start:start + self.record_size]
+
+    def __getitem__(self, k: int) -> List[List[int]]:
+        """
+        Returns the board of record k
+        """
+        with self.record(k) as record:
+            return unpack_cells(record[:self.cell_bytes].tobytes(), self.rows, self.cols)
+
+    def __iter__(self):
+        for k in range(self.count):
+            yield self[k]
+
+    def result(self, k: int) -> Tuple[List[List[int]], int, List[List[float]]]:
+        """
+        Returns (board, solution count, mine probabilities) of a RESULTS record
+        """
+        if self.kind != RESULTS:
+            raise ValueError(f"a {KINDS[self.kind]} corpus holds no solver results")
+        with self.record(k) as record:
+            data = record.tobytes()
+        board = unpack_cells(data[:self.cell_bytes], self.rows, self.cols)
+        (solutions,) = COUNT.unpack_from(data, self.cell_bytes)
+        levels = data[self.cell_bytes + COUNT.size:]
+        probs = [[level / 255 for level in levels[i * self.cols:(i + 1) * self.cols]]
+                 for i in range(self.rows)]
+        return board, solutions, probs
+
+    def numpy(self):
+        """
+        Returns the records as a NumPy structured array over the memory map, without
+        copying: "cells" holds the packed cell bytes (see unpack_numpy()), and RESULTS
+        corpora add "solutions" and "probs". Requires NumPy; delete the array before
+        close().
+        """
+        import numpy as np
+
+        fields = [("cells", np.uint8, (self.cell_bytes,))]
+        if self.kind == RESULTS:
+            fields += [("solutions", "<u8"), ("probs", np.uint8, (self.rows, self.cols))]
+        return np.frombuffer(self.mm, dtype=np.dtype(fields), count=self.count,
+                             offset=HEADER_SIZE)
+
+    def unpack_numpy(self, cells):
+        """
+        Unpacks a (records, cell bytes) array of packed cells into a
+        (records, rows, cols) int8 array of board values
+        """
+        import numpy as np
+
+        codes = np.empty(cells.shape[:-1] + (2 * self.cell_bytes,), dtype=np.int8)
+        codes[..., 0::2] = cells >> 4
+        codes[..., 1::2] = cells & 0xF
+        values = codes[..., :self.rows * self.cols] - CODE_OFFSET
+        return values.reshape(cells.shape[:-1] + (self.rows, self.cols))
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
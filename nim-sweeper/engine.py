@@ -0,0 +1,121 @@
+import random
+from typing import List, Tuple
+
+import nimsweeper as ns
+
+
+# ------------------ CELL MARKS -------------------- #
+NO_MARK = 0
+FLAG = 1
+CONFIRMED_FLAG = 2
+
+
+class GameEngine:
+    """
+    The rules of one Minesweeper game, without a display: truth generation, reveals,
+    flags and the win check. Visualize draws and drives one of these, and batch tools
+    (bots, solver regression runs) can play millions of moves without importing pygame.
+
+    game is the player's view in the layout the solver functions take (UNKNOWN for
+    hidden cells); revealed and marks are one bytearray per row, and the win and loss
+    checks use counters kept up to date by each move instead of scanning the board.
+    """
+
+    def __init__(self, rows: int = ns.ROWS, cols: int = ns.COLS, mine_cnt: int = ns.MINE_CNT,
+                 rng: random.Random = None, mine_value: int = ns.MINE):
+        self.rows = rows
+        self.cols = cols
+        self.mine_cnt = mine_cnt
+        self.rng = rng
+        self.mine_value = mine_value
+        self.new_game()
+
+    # -------------- SETUP ---------------- #
+
+    def new_game(self, mines: int = None):
+        """
+        Starts a game on a packed mine mask, or on freshly placed mines if none is given
+        """
+        if mines is None:
+            mines = ns.place_mines(self.rows, self.cols, self.mine_cnt, self.rng)
+        self.truth = ns.truth_board(mines, self.rows, self.cols, mine_value=self.mine_value)
+        self.mines = ns.mine_cells(mines, self.cols)
+        self._clear()
+
+    def design(self):
+        """
+        Starts an empty board with no mines, for the player to fill in by hand
+        """
+        self.truth = [[0] * self.cols for _ in range(self.rows)]
+        self.mines = []
+        self._clear()
+
+    def _clear(self):
+        self.game = [[ns.UNKNOWN] * self.cols for _ in range(self.rows)]
+        self.revealed = [bytearray(self.cols) for _ in range(self.rows)]
+        self.marks = [bytearray(self.cols) for _ in range(self.rows)]
+        self.completed = False
+        self.win = False
+        self.moves = 0
+        self.hidden_safe = self.rows * self.cols - len(self.mines)
+        self.flagged_mines = 0
+
+    # -------------- MOVES ---------------- #
+
+    def reveal(self, i: int, j: int) -> List[Tuple[int, int]]:
+        """
+        Plays (i, j) and returns the cells it revealed as one batch. A mine ends the
+        game as a loss, and revealing the last safe cell ends it as a win. Confirmed
+        flags protect their cell; plain flags are only a reminder for the player.
+        """
+        if self.completed or self.marks[i][j] == CONFIRMED_FLAG or self.revealed[i][j]:
+            return []
+        self.moves += 1
+        if self.truth[i][j] == self.mine_value:
+            self.game[i][j] = self.truth[i][j]
+            self.revealed[i][j] = True
+            self.completed = True
+            return [(i, j)]
+        cells = ns.reveal_region(self.truth, self.game, i, j, self.revealed)
+        # flags on the revealed (safe) cells are dropped, they never counted toward a win
+        for r, c in cells:
+            self.marks[r][c] = NO_MARK
+        self.hidden_safe -= len(cells)
+        if self.hidden_safe == 0:
+            self.completed = True
+            self.win = True
+        return cells
+
+    def toggle_flag(self, i: int, j: int) -> bool:
+        """
+        Flags a hidden cell, or removes the flag that is on it. Returns whether the cell
+        is now flagged.
+        """
+        if self.marks[i][j]:
+            self.set_mark(i, j, NO_MARK)
+        elif self.game[i][j] == ns.UNKNOWN:
+            self.set_mark(i, j, FLAG)
+        return bool(self.marks[i][j])
+
+    def set_mark(self, i: int, j: int, mark: int):
+        if self.truth[i][j] == self.mine_value:
+            self.flagged_mines += bool(mark) - bool(self.marks[i][j])
+        self.marks[i][j] = mark
+
+    def set_cell(self, i: int, j: int, value: int):
+        """
+        Design mode: writes value into the player's view and drops any mark on the cell
+        """
+        self.set_mark(i, j, NO_MARK)
+        self.game[i][j] = value
+
+    # -------------- CHECKS ---------------- #
+
+    def check_completed(self) -> bool:
+        """
+        Ends the game as a win once every mine carries a flag
+        """
+        if not self.completed and self.mines and self.flagged_mines == len(self.mines):
+            self.completed = True
+            self.win = True
+        return self.win
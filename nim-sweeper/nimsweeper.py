@@ -1,4 +1,17 @@
+import contextlib
+import hashlib
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+import pickle
 import random
+import time
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from math import comb, log2, prod
+from statistics import NormalDist
 from typing import List, Tuple, Dict
 from z3 import *
 
@@ -23,92 +36,273 @@ PRINT_ALL: bool = False
 
 LIMIT_SOL_SPACE: bool = True
 SOL_LIMIT: int = 1000
+ENCODING: str = "int"  # "int" (Int + Sum) or "bool" (Bool + PbEq), see ENCODINGS
+SPARSE: bool = True  # solve() gives z3 only the frontier, see build_sparse_solver()
+NO_TIMEOUT: int = 4294967295  # z3's default "timeout" (ms), i.e. none
+CERTAIN_STATES: int = 10000  # sweep states certain_cells() counts a component with before z3
+MOVE_WIDTH: int = 8  # candidate cells best_moves() scores in depth, the safest first
+SAMPLE_WINDOW: int = 16  # frontier cells SolutionSampler redraws together in one step
+SAMPLE_BATCHES: int = 10  # batches sample_probabilities() draws before trusting its intervals
 
 # -------------- GAME BOARD GENERATOR ---------------- #
 
 
-def generate_board(rows: int, cols: int, mine_cnt: int) -> List[List[int]]:
+def place_mines(rows: int, cols: int, mine_cnt: int, rng: random.Random = None,
+                exclude: set = None) -> int:
+    """
+    Picks mine_cnt distinct cells with a single partial permutation and packs them
+    into an int whose bit i * cols + j is set if (i, j) is a mine.
+    Cell indices in exclude never get a mine.
+    """
+    rng = rng or random
+    cells = range(rows * cols)
+    if exclude:
+        cells = [cell for cell in cells if cell not in exclude]
+    # set the bits in a bitstring, summing big ints is quadratic on large boards
+    bits = bytearray(b"0" * (rows * cols))
+    for cell in rng.sample(cells, mine_cnt):
+        bits[-1 - cell] = 49  # "1"
+    return int(bits, 2) if bits else 0
+
+
+_BIT_BYTES = bytes.maketrans(b"01", bytes(range(2)))
+
+
+def _bits(mask: int, cells: int) -> str:
+    # "0"/"1" for every cell of a packed mask, lowest bit first
+    return format(mask, f"0{cells}b")[::-1]
+
+
+def mine_cells(mines: int, cols: int) -> List[Tuple[int, int]]:
+    """
+    Returns the (row, col) of every mine in a packed mine mask
+    """
+    bits = bin(mines)[:1:-1]
+    return [divmod(cell, cols) for cell, bit in enumerate(bits) if bit == "1"]
+
+
+def neighbor_counts(mines: int, rows: int, cols: int) -> List[int]:
+    """
+    Returns the number of adjacent mines of every cell, in row-major order.
+
+    The mask is shifted once per neighbor offset and the eight shifted masks are
+    added with bit-sliced counters, so every cell of the board is counted at once.
+    """
+    full = (1 << (rows * cols)) - 1
+    first_col = int(("0" * (cols - 1) + "1") * rows, 2)
+    not_first = full & ~first_col
+    not_last = full & ~(first_col << (cols - 1))
+
+    # neighbors to the left / right of each cell, then all three shifted up / down
+    left = (mines << 1) & not_first
+    right = (mines >> 1) & not_last
+    shifted = [left, right]
+    for mask in (mines, left, right):
+        shifted += [(mask << cols) & full, mask >> cols]
+
+    planes = [0, 0, 0, 0]
+    for mask in shifted:
+        carry = mask
+        for p in range(4):
+            planes[p], carry = planes[p] ^ carry, planes[p] & carry
+    # Every plane is spread to one byte per cell, so the four add up in a single big
+    # int whose bytes are the counts (as in mine_counts())
+    cells = rows * cols
+    total = 0
+    for p, plane in enumerate(planes):
+        bits = format(plane, f"0{cells}b").encode().translate(_BIT_BYTES)
+        total += int.from_bytes(bits, "big") << p
+    return list(total.to_bytes(cells, "little"))
+
+
+def truth_board(mines: int, rows: int, cols: int, mine_value: int = MINE) -> List[List[int]]:
+    """
+    Returns the fully revealed board for a packed mine mask
+    """
+    counts = neighbor_counts(mines, rows, cols)
+    bits = _bits(mines, rows * cols)
+    return [[mine_value if bits[i * cols + j] == "1" else counts[i * cols + j]
+             for j in range(cols)] for i in range(rows)]
+
+
+def generate_truth(rows: int, cols: int, mine_cnt: int,
+                   rng: random.Random = None, mine_value: int = MINE) -> List[List[int]]:
+    """
+    Generates a fully revealed board with mine_cnt randomly placed mines
+    """
+    return truth_board(place_mines(rows, cols, mine_cnt, rng), rows, cols, mine_value)
+
+
+def generate_truths(count: int, rows: int, cols: int, mine_cnt: int,
+                    seed: int = None, mine_value: int = MINE) -> List[List[List[int]]]:
+    """
+    Generates count fully revealed boards at once from a seeded RNG.
+
+    The boards are stacked into one mask with an empty separator row between them,
+    so a single neighbor_counts() call counts every board in the batch. Each row is
+    then a slice of the counts, and only the mines are written over one by one.
+    """
+    if not count:
+        return []
+    rng = random.Random(seed)
+    stride = (rows + 1) * cols
+    bits = bytearray(b"0" * (count * stride))
+    placed = []
+    for n in range(count):
+        mines = rng.sample(range(rows * cols), mine_cnt)
+        for cell in mines:
+            bits[n * stride + cell] = ord("1")
+        placed.append(mines)
+    stacked = int(bits[::-1], 2) if bits else 0
+    counts = neighbor_counts(stacked, count * (rows + 1), cols)
+
+    boards = []
+    for n, mines in enumerate(placed):
+        base = n * stride
+        board = [counts[start:start + cols] for start in range(base, base + rows * cols, cols)]
+        for cell in mines:
+            board[cell // cols][cell % cols] = mine_value
+        boards.append(board)
+    return boards
+
+
+def generate_board(rows: int, cols: int, mine_cnt: int,
+                   rng: random.Random = None) -> List[List[int]]:
     """
     Generate a board of size rows x cols with mine_cnt mines randomly placed
     """
     # randomly generate a board of size rows x cols
     # A number represents the number of mines around it.
     # X (-1) represents an unknown on whether it is a mine or not.
+    mines = place_mines(rows, cols, mine_cnt, rng)
+    print(mine_cells(mines, cols))
+    return mask_board(truth_board(mines, rows, cols))
 
-    # Initialize the board
-    board = [[0 for _ in range(cols)] for _ in range(rows)]
 
-    # Sample of indices for the mines
-    mine_indices = random.sample([(r, c) for r in range(rows)
-                                  for c in range(cols)], mine_cnt)
-    print(mine_indices)
+def mask_board(board: List[List[int]]) -> List[List[int]]:
+    """
+    Hides the blanks (and the mines, unless KEEP_MINES_KNOWN) of a revealed board in place
+    """
+    for row in board:
+        for col in range(len(row)):
+            if row[col] == 0:
+                row[col] = UNKNOWN
+            if row[col] == MINE and not KEEP_MINES_KNOWN:
+                row[col] = UNKNOWN
 
-    # Place the mines in the board
-    for row, col in mine_indices:
-        board[row][col] = MINE
+    return board
 
-    # Place the numbers according to the mines placed
-    for row in range(rows):
-        for col in range(cols):
-            if board[row][col] == UNKNOWN or board[row][col] == MINE:
-                continue
 
-            adjacents = [(row + r, col + c) for r in [-1, 0, 1]
-                         for c in [-1, 0, 1] if r != 0 or c != 0]
-            adj_mine_count = sum(1 for r, c in adjacents if 0 <=
-                                 r < rows and 0 <= c < cols and board[r][c] == MINE)
-            board[row][col] = adj_mine_count
+# ------------------ ENCODINGS -------------------- #
 
-    for row in range(rows):
-        for col in range(cols):
-            if board[row][col] == 0:
-                board[row][col] = UNKNOWN
-            if board[row][col] == MINE and not KEEP_MINES_KNOWN:
-                board[row][col] = UNKNOWN
+class IntEncoding:
+    """
+    Each cell is an Int bounded to 0..1 and counts are arithmetic Sums,
+    which z3 handles with its linear integer arithmetic engine.
+    """
+    name = "int"
 
-    return board
+    def solver(self) -> Solver:
+        return Solver()
+
+    def declare(self, sol: Solver, name: str):
+        var = Int(name)
+        sol.add(var >= 0, var <= 1)
+        return var
+
+    def mine(self, var):
+        return var == 1
+
+    def safe(self, var):
+        return var == 0
+
+    def exactly(self, cells: list, k: int):
+        return Sum(cells) == k
+
+    def at_most(self, cells: list, k: int):
+        return Sum(cells) <= k
+
+    def at_least(self, cells: list, k: int):
+        return Sum(cells) >= k
+
+    def is_mine(self, mod: ModelRef, var) -> bool:
+        return mod.eval(var, model_completion=True).as_long() == 1
+
+    def differs(self, var, is_mine: bool):
+        return var != (1 if is_mine else 0)
+
+
+class BoolEncoding:
+    """
+    Each cell is a Bool and counts are pseudo-Boolean constraints,
+    which z3 handles natively in its SAT core.
+    """
+    name = "bool"
+
+    def solver(self) -> Solver:
+        return SolverFor("QF_FD")
+
+    def declare(self, sol: Solver, name: str):
+        return Bool(name)
+
+    def mine(self, var):
+        return var
+
+    def safe(self, var):
+        return Not(var)
+
+    def exactly(self, cells: list, k: int):
+        return PbEq([(var, 1) for var in cells], k)
+
+    def at_most(self, cells: list, k: int):
+        return PbLe([(var, 1) for var in cells], k)
+
+    def at_least(self, cells: list, k: int):
+        return PbGe([(var, 1) for var in cells], k)
+
+    def is_mine(self, mod: ModelRef, var) -> bool:
+        return is_true(mod.eval(var, model_completion=True))
+
+    def differs(self, var, is_mine: bool):
+        return Not(var) if is_mine else var
+
+
+ENCODINGS = {enc.name: enc for enc in (IntEncoding(), BoolEncoding())}
 
 
 # ----------------- MINESWEEPER ------------------ #
 
-def likely_mines(solutions: List[List[List[int]]]) -> Tuple[List[Tuple[int, int]], float]:
-    mine_counts = {}
+def likely_mines(solutions: List[int],
+                 init_board: List[List[int]]) -> Tuple[List[Tuple[int, int]], float]:
+    cols = len(init_board[0])
     total_solutions = len(solutions)
-    for solution in solutions:
-        for i, row in enumerate(solution):
-            for j, cell in enumerate(row):
-                if cell == MINE:
-                    mine_counts[(i, j)] = mine_counts.get((i, j), 0) + 1
+    counts = mine_counts(solutions, len(init_board) * cols)
 
-    sorted_mines = sorted(mine_counts.items(), key=lambda x: -x[1])
-    if len(sorted_mines) == 0:
+    top_count = max(counts, default=0)
+    if top_count == 0:
         return [], 1
-    top_count = sorted_mines[0][1]
     # get all the mines that are most likely (same top count)
-    most_likely_mines = [mine for mine,
-                         count in sorted_mines if count == top_count]
+    most_likely_mines = [divmod(cell, cols) for cell, count in enumerate(counts)
+                         if count == top_count]
     percentage_likelihood = top_count / total_solutions
 
     return most_likely_mines, percentage_likelihood
 
 
-def likely_safe(solutions: List[List[List[int]]],
+def likely_safe(solutions: List[int],
                 init_board: List[List[int]]) -> Tuple[List[Tuple[int, int]], float]:
-    safe_counts = {}
+    cols = len(init_board[0])
     total_solutions = len(solutions)
-    for solution in solutions:
-        for i, row in enumerate(solution):
-            for j, cell in enumerate(row):
-                if cell != MINE and init_board[i][j] == UNKNOWN:
-                    safe_counts[(i, j)] = safe_counts.get((i, j), 0) + 1
+    counts = mine_counts(solutions, len(init_board) * cols)
+    safe_counts = [total_solutions - count if init_board[cell // cols][cell % cols] == UNKNOWN
+                   else 0 for cell, count in enumerate(counts)]
 
-    sorted_safe = sorted(safe_counts.items(), key=lambda x: -x[1])
-    if len(sorted_safe) == 0:
+    top_count = max(safe_counts, default=0)
+    if top_count == 0:
         return [], 1
-    top_count = sorted_safe[0][1]
     # get all the mines that are most likely (same top count)
-    most_likely_safe = [safe for safe,
-                        count in sorted_safe if count == top_count]
+    most_likely_safe = [divmod(cell, cols) for cell, count in enumerate(safe_counts)
+                        if count == top_count]
     percentage_likelihood = top_count / total_solutions
 
     return most_likely_safe, percentage_likelihood
@@ -118,88 +312,2543 @@ def solve(game: List[List[int]],
           mine_cnt: int = MINE_CNT,
           blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
           constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
-          limit_sols: bool = LIMIT_SOL_SPACE
+          limit_sols: bool = LIMIT_SOL_SPACE,
+          encoding: str = ENCODING,
+          timeout: float = None,
+          stats: "SolveStats" = None,
+          rlimit: int = None,
+          max_memory: int = None,
+          sparse: bool = SPARSE
           ) -> int:
+    """
+    Enumerates the solutions of a board, returning (count, packed solutions).
+
+    limit_sols stops past SOL_LIMIT solutions, and sparse gives z3 only the frontier
+    (see build_sparse_solver()). The budget is optional: timeout (seconds for the
+    whole solve), rlimit (z3 resource units per check()) and max_memory (megabytes);
+    once one runs out, the solutions found so far are returned.
+    """
+    if sparse:
+        return collect_solutions(iter_solutions(game, mine_cnt, blanks_no_adj, constrain_mines,
+                                                encoding, timeout, stats, rlimit, max_memory,
+                                                sparse), limit_sols)
+    enc = ENCODINGS[encoding]
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    sol, mines = build_solver(game, mine_cnt, blanks_no_adj, constrain_mines, enc, stats)
+    set_budget(sol, rlimit, max_memory)
+    return enumerate_solutions(sol, game, mines, limit_sols, enc, _time_left(deadline), stats)
+
+
+def iter_solutions(game: List[List[int]],
+                   mine_cnt: int = MINE_CNT,
+                   blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                   constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                   encoding: str = ENCODING,
+                   timeout: float = None,
+                   stats: "SolveStats" = None,
+                   rlimit: int = None,
+                   max_memory: int = None,
+                   sparse: bool = SPARSE):
+    """
+    Lazily yields the packed solutions (see pack_solution) of a board as z3 finds them.
+    Stop iterating (or islice the generator) to end the search early; nothing is printed.
+    The dense encoding only holds the current solution in memory; with sparse, every
+    frontier model with more than one completion is held until z3 has found them all
+    (see complete_interior()). The budget is the same as solve()'s.
+    """
+    enc = ENCODINGS[encoding]
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    if not sparse:
+        sol, mines = build_solver(game, mine_cnt, blanks_no_adj, constrain_mines, enc, stats)
+        set_budget(sol, rlimit, max_memory)
+        yield from models(sol, game, mines, enc, _time_left(deadline), stats)
+        return
+    sol, mines, interior, known = build_sparse_solver(game, mine_cnt, blanks_no_adj,
+                                                      constrain_mines, enc, stats)
+    set_budget(sol, rlimit, max_memory)
+    found = models(sol, game, mines, enc, _time_left(deadline), stats)
+    remaining = mine_cnt - bin(known).count("1") if constrain_mines else None
+    try:
+        yield from complete_interior(found, interior, len(game[0]), known, remaining,
+                                     _time_left(deadline), stats)
+    finally:
+        found.close()
+
+
+def has_solution(game: List[List[int]],
+                 mine_cnt: int = MINE_CNT,
+                 blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                 constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                 encoding: str = ENCODING,
+                 timeout: float = None,
+                 stats: "SolveStats" = None,
+                 rlimit: int = None,
+                 max_memory: int = None,
+                 sparse: bool = SPARSE) -> bool:
+    """
+    True if the board is consistent, using a single check() and no model.
+    Returns None if the budget runs out before z3 can tell; the timeout covers
+    building the constraints too.
+    """
+    enc = ENCODINGS[encoding]
+    stats = stats or _NO_STATS
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    build = build_sparse_solver if sparse else build_solver
+    sol = build(game, mine_cnt, blanks_no_adj, constrain_mines, enc, stats)[0]
+    set_budget(sol, rlimit, max_memory)
+    if deadline is not None:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            stats.result = "timeout"
+            return None
+        sol.set("timeout", max(1, int(remaining * 1000)))
+    with stats.phase("check"):
+        result = sol.check()
+    stats.result = str(result)
+    stats.record_z3(sol)
+    if result == unknown:
+        stats.reason = sol.reason_unknown()
+        return None
+    return result == sat
+
+
+def iter_configurations(game: List[List[int]],
+                        mine_cnt: int = MINE_CNT,
+                        blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                        constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                        encoding: str = ENCODING,
+                        timeout: float = None,
+                        stats: "SolveStats" = None,
+                        rlimit: int = None,
+                        max_memory: int = None):
+    """
+    Projected enumeration: lazily yields (configuration, completions) once for every
+    distinct assignment of the frontier, where configuration is packed like a solution
+    (frontier mines plus the mines already on the board) and completions is the number
+    of ways to place the interior's mines around it. The completions of all
+    configurations add up to the number of solutions of the board.
+    """
+    enc = ENCODINGS[encoding]
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    sol, mines, interior, known = build_sparse_solver(game, mine_cnt, blanks_no_adj,
+                                                      constrain_mines, enc, stats)
+    set_budget(sol, rlimit, max_memory)
+    remaining = mine_cnt - bin(known).count("1")
+    found = models(sol, game, mines, enc, _time_left(deadline), stats)
+    try:
+        for frontier in found:
+            if constrain_mines:
+                completions = comb(len(interior), remaining - bin(frontier).count("1"))
+            else:
+                completions = 1 << len(interior)
+            yield frontier | known, completions
+    finally:
+        found.close()
+
+
+def solve_projected(game: List[List[int]],
+                    mine_cnt: int = MINE_CNT,
+                    blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                    constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                    limit_sols: bool = LIMIT_SOL_SPACE,
+                    encoding: str = ENCODING,
+                    timeout: float = None,
+                    stats: "SolveStats" = None,
+                    rlimit: int = None,
+                    max_memory: int = None) -> int:
+    """
+    Like solve(), but returns (count, [(configuration, completions), ...]) from
+    iter_configurations(), so SOL_LIMIT caps distinct frontier assignments instead
+    of interior permutations that tell the frontier nothing new. The budget is the
+    same as solve()'s.
+    """
+    return collect_solutions(iter_configurations(game, mine_cnt, blanks_no_adj, constrain_mines,
+                                                 encoding, timeout, stats, rlimit, max_memory),
+                             limit_sols)
+
+
+def projected_probabilities(configurations, game: List[List[int]],
+                            mine_cnt: int = MINE_CNT,
+                            blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                            constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT
+                            ) -> List[List[float]]:
+    """
+    Mine probability of every cell over the (configuration, completions) pairs of
+    solve_projected(), each weighted by its completions, in the layout of
+    mine_probabilities() (so likely_mines_exact() and likely_safe_exact() apply).
+    Exact if every configuration was enumerated. Returns None without any.
+    """
+    rows = len(game)
+    cols = len(game[0])
+    split = frontier_constraints(game, blanks_no_adj)
+    total = sum(completions for _, completions in configurations)
+    if split is None or not total:
+        return None
+    constraints, interior, known_mines = split
+    frontier = sorted({cell for cells, _ in constraints for cell in cells})
+
+    weights = {cell: 0 for cell in frontier}
+    interior_mines = 0  # expected interior mines, times total
+    for configuration, completions in configurations:
+        placed = known_mines
+        for i, j in frontier:
+            if configuration >> (i * cols + j) & 1:
+                weights[(i, j)] += completions
+                placed += 1
+        if constrain_mines:
+            interior_mines += completions * (mine_cnt - placed)
+        else:
+            interior_mines += completions * len(interior) / 2
+
+    probs = [[1.0 if game[i][j] == MINE else 0.0 for j in range(cols)]
+             for i in range(rows)]
+    for (i, j), weight in weights.items():
+        probs[i][j] = weight / total
+    for i, j in interior:
+        probs[i][j] = interior_mines / total / len(interior)
+    return probs
+
+
+def set_budget(sol: Solver, rlimit: int = None, max_memory: int = None):
+    """
+    Caps the z3 resource units of each check() and the megabytes z3 may allocate
+    """
+    if rlimit is not None:
+        sol.set("rlimit", rlimit)
+    if max_memory is not None:
+        sol.set("max_memory", max_memory)
+
+
+def _time_left(deadline: float):
+    # the timeout that runs out at a deadline on time.perf_counter(), for passing
+    # one budget on to the steps that share it
+    return None if deadline is None else deadline - time.perf_counter()
+
+
+def build_solver(game: List[List[int]],
+                 mine_cnt: int = MINE_CNT,
+                 blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                 constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                 enc=ENCODINGS["int"],
+                 stats: "SolveStats" = None):
+    """
+    Returns a fresh z3 solver holding the board's constraints and its (i, j) -> variable dict
+    """
     # Using the z3 solver
-    sol = Solver()
+    stats = stats or _NO_STATS
+    with stats.phase("build"):
+        sol = enc.solver()
+
+        # Set default values of rows and columns
+        r = len(game)
+        c = len(game[0])
+
+        # Declare variables
+        mines = {}
+        for i in range(r):
+            for j in range(c):
+                mines[(i, j)] = enc.declare(sol, f"mines_{i}_{j}")
+
+        # Constraints
+        constraints = 0
+        for i in range(r):
+            for j in range(c):
+                cell = cell_constraints(game, mines, i, j, enc)
+                sol.add(cell)
+                constraints += len(cell)
+                if blanks_no_adj and blank_has_no_info(game, i, j):
+                    # If an unknown tile is not adjacent to a numbered tile,
+                    # it must not contain a mine
+                    sol.add(enc.safe(mines[(i, j)]))
+                    constraints += 1
+
+        if constrain_mines:  # Constrain the number of mines to match the game
+            sol.add(enc.exactly([mines[i, j] for i in range(r)
+                                 for j in range(c)], mine_cnt))
+            constraints += 1
+    stats.constraints = constraints
+    return sol, mines
+
+
+def build_sparse_solver(game: List[List[int]],
+                        mine_cnt: int = MINE_CNT,
+                        blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                        constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                        enc=ENCODINGS["int"],
+                        stats: "SolveStats" = None):
+    """
+    Like build_solver(), but only the unknown cells next to a number get a variable.
+    Revealed cells are left out, and the interior (unknown cells no number sees) is
+    one aggregate: with constrain_mines, the frontier's mine count must leave between
+    0 and len(interior) mines for it. The constraints grow with the frontier, not the
+    board, so large boards stay cheap as long as their frontier is.
+
+    Returns (sol, frontier cell -> variable dict, interior cells, packed mask of the
+    mines already on the board); complete_interior() turns the models into solutions.
+    """
+    stats = stats or _NO_STATS
+    with stats.phase("build"):
+        sol = enc.solver()
+        split = frontier_constraints(game, blanks_no_adj)
+        if split is None:
+            # a number can no longer be satisfied
+            sol.add(BoolVal(False))
+            return sol, {}, [], 0
+        constraints, interior, _ = split
+        known = pack_solution(game)
+
+        mines = {}
+        for cells, need in constraints:
+            for i, j in cells:
+                if (i, j) not in mines:
+                    mines[(i, j)] = enc.declare(sol, f"mines_{i}_{j}")
+            sol.add(enc.exactly([mines[cell] for cell in cells], need))
+
+        if constrain_mines:
+            remaining = mine_cnt - bin(known).count("1")
+            if not mines:
+                sol.add(BoolVal(0 <= remaining <= len(interior)))
+                stats.constraints = len(constraints) + 1
+            else:
+                frontier = list(mines.values())
+                sol.add(enc.at_most(frontier, remaining))
+                sol.add(enc.at_least(frontier, remaining - len(interior)))
+                stats.constraints = len(constraints) + 2
+        else:
+            stats.constraints = len(constraints)
+    return sol, mines, interior, known
+
+
+def complete_interior(found, interior: List[Tuple[int, int]], cols: int, known: int,
+                      remaining: int = None, timeout: float = None,
+                      stats: "SolveStats" = None):
+    """
+    Expands the frontier models of a sparse solver into full packed solutions, placing
+    the interior's mines every possible way: exactly the remaining ones if remaining
+    is given, otherwise any number of them. Stops once the timeout (seconds) runs out.
+
+    Every frontier model first gets one completion as z3 finds it, and only then are
+    the other completions of each model listed in turn, so a solve cut short by
+    SOL_LIMIT or the timeout still covers as many frontier configurations as it can.
+    The models with completions left over are held in memory until found runs out.
+    """
+    stats = stats or _NO_STATS
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    cells = [i * cols + j for i, j in interior]
+
+    def completions(frontier: int):
+        if remaining is None:
+            counts = range(len(cells) + 1)
+        else:
+            counts = [remaining - bin(frontier).count("1")]
+        for k in counts:
+            yield from _choose_bits(frontier | known, cells, k)
+
+    def expired() -> bool:
+        if deadline is not None and time.perf_counter() > deadline:
+            stats.result = "timeout"
+            return True
+        return False
+
+    frontiers = []
+    for frontier in found:
+        rest = completions(frontier)
+        first = next(rest, None)
+        if expired():
+            return
+        if first is not None:
+            if next(rest, None) is not None:
+                frontiers.append(frontier)
+            yield first
+    for frontier in frontiers:
+        rest = completions(frontier)
+        next(rest)
+        for solution in rest:
+            if expired():
+                return
+            yield solution
 
-    # Set default values of rows and columns
+
+def _choose_bits(base: int, cells: List[int], k: int):
+    # yields base with every k of the bits in cells set, in lexicographic order; each
+    # step flips only the bits whose choice changed, so none of the per-cell masks of
+    # a large board are ever built
+    n = len(cells)
+    if not 0 <= k <= n:
+        return
+    chosen = list(range(k))
+    bits = bytearray(b"0" * (max(cells[:k], default=-1) + 1))
+    for x in chosen:
+        bits[-1 - cells[x]] = 49  # "1"
+    mask = base | int(bits, 2) if bits else base
+    while True:
+        yield mask
+        x = k - 1
+        while x >= 0 and chosen[x] == n - k + x:
+            x -= 1
+        if x < 0:
+            return
+        for y in range(x, k):
+            mask ^= 1 << cells[chosen[y]]
+        chosen[x] += 1
+        for y in range(x, k):
+            if y > x:
+                chosen[y] = chosen[y - 1] + 1
+            mask ^= 1 << cells[chosen[y]]
+
+
+def cell_constraints(game: List[List[int]], mines, i: int, j: int,
+                     enc=ENCODINGS["int"]) -> list:
+    """
+    Returns the constraints a revealed cell places on the mine variables
+    """
     r = len(game)
     c = len(game[0])
+    adj = [-1, 0, 1]
+    if game[i][j] == MINE:
+        return [enc.mine(mines[(i, j)])]
+    if game[i][j] > UNKNOWN:
+        return [
+            enc.exactly([mines[i+a, j+b]
+                         for a in adj for b in adj
+                         if i + a > UNKNOWN and
+                         j + b > UNKNOWN and
+                         i + a < r and
+                         j + b < c], game[i][j]),
+            # Cannot be a mine if it is a number
+            enc.safe(mines[i, j])
+        ]
+    return []
 
-    # Declare variables
-    mines = {}
-    for i in range(r):
-        for j in range(c):
-            mines[(i, j)] = Int(f"mines_{i}{j}")
-            sol.add(mines[(i, j)] >= 0, mines[(i, j)] <= 1)
 
-    # Constraints
+def blank_has_no_info(game: List[List[int]], i: int, j: int) -> bool:
+    """
+    True if (i, j) and all of its neighbors are still unknown
+    """
+    r = len(game)
+    c = len(game[0])
     adj = [-1, 0, 1]
-    for i in range(r):
-        for j in range(c):
-            if game[i][j] == MINE:
-                sol.add(mines[(i, j)] == 1)
-            if game[i][j] > UNKNOWN:
-                sol.add(
-                    game[i][j] == Sum([mines[i+a, j+b]
-                                       for a in adj for b in adj
-                                       if i + a > UNKNOWN and
-                                       j + b > UNKNOWN and
-                                       i + a < r and
-                                       j + b < c])
-                )
-                # Cannot be a mine if it is a number
-                sol.add(mines[i, j] == 0)
-            elif blanks_no_adj:
-                # else:
-                # If an unknown tile is not adjacent to a numbered tile,
-                # it must not contain a mine
-                if all(game[i+a][j+b] == UNKNOWN
-                       for a in adj for b in adj
-                       if i + a > UNKNOWN and
-                       j + b > UNKNOWN and
-                       i + a < r and
-                       j + b < c):
-                    sol.add(mines[(i, j)] == 0)
-
-    if constrain_mines:  # Constrain the number of mines to match the game
-        sol.add(Sum([mines[i, j] for i in range(r)
-                for j in range(c)]) == mine_cnt)
-
-    num_solutions = 0
-    solutions = []
-    while sol.check() == sat and (num_solutions <= SOL_LIMIT or not limit_sols):
-        num_solutions += 1
-        mod = sol.model()
-        solutions.append(solution_board(game, mines, mod))
+    return all(game[i+a][j+b] == UNKNOWN
+               for a in adj for b in adj
+               if i + a > UNKNOWN and
+               j + b > UNKNOWN and
+               i + a < r and
+               j + b < c)
 
-        # Finding more solutions by excluding the current solution
-        sol.add(Or([mines[i, j] != mod.eval(mines[i, j])
-                for i in range(r) for j in range(c)]))
+
+def enumerate_solutions(sol: Solver, game: List[List[int]], mines,
+                        limit_sols: bool = LIMIT_SOL_SPACE,
+                        enc=ENCODINGS["int"],
+                        timeout: float = None,
+                        stats: "SolveStats" = None):
+    """
+    Enumerates the models of sol with blocking clauses, returning (count, solutions)
+    where each solution is packed into an int (see pack_solution).
+    With a timeout (seconds, see models), stops with the solutions found so far once
+    it runs out.
+    A SolveStats passed as stats is filled in with the time spent in each phase.
+    """
+    return collect_solutions(models(sol, game, mines, enc, timeout, stats), limit_sols)
+
+
+def collect_solutions(found, limit_sols: bool = LIMIT_SOL_SPACE):
+    """
+    Drains a solution generator into (count, solutions), stopping past SOL_LIMIT
+    when limit_sols is set
+    """
+    solutions = list(itertools.islice(found, SOL_LIMIT + 1) if limit_sols else found)
+    found.close()
+    num_solutions = len(solutions)
     print("num_solutions:", num_solutions) if num_solutions < 100 else print(
         "num_solutions: 100+")
     return num_solutions, solutions
 
 
-# ------------- BOARD PRINTING ---------------- #
+def models(sol: Solver, game: List[List[int]], mines,
+           enc=ENCODINGS["int"],
+           timeout: float = None,
+           stats: "SolveStats" = None):
+    """
+    Yields the models of sol as packed solutions, blocking each one only when the
+    next is asked for. With a timeout (seconds, counted from the first model asked
+    for), stops once it runs out: check() is interrupted, and reading a model or
+    blocking it is not started past it.
+    """
+    c = len(game[0])
+    stats = stats or _NO_STATS
+    deadline = None if timeout is None else time.perf_counter() + timeout
+
+    def expired() -> bool:
+        if deadline is not None and time.perf_counter() >= deadline:
+            stats.result = "timeout"
+            return True
+        return False
+
+    try:
+        while True:
+            if expired():
+                return
+            if deadline is not None:
+                sol.set("timeout", max(1, int((deadline - time.perf_counter()) * 1000)))
+            with stats.phase("check"):
+                result = sol.check()
+            stats.result = str(result)
+            if result == unknown:
+                # the budget ran out, or z3 gave up
+                reason = sol.reason_unknown()
+                stats.reason = reason
+                if reason in ("timeout", "canceled") and deadline is not None:
+                    stats.result = "timeout"
+            if result != sat:
+                return
+            if expired():
+                return
+            with stats.phase("model"):
+                mod = sol.model()
+            with stats.phase("eval"):
+                is_mine = {cell: enc.is_mine(mod, var) for cell, var in mines.items()}
+                solution = sum(1 << (i * c + j) for (i, j), mine in is_mine.items() if mine)
+            stats.solutions += 1
+            yield solution
+            if expired():
+                return
+
+            # Finding more solutions by excluding the current solution
+            with stats.phase("block"):
+                sol.add(Or([enc.differs(mines[cell], mine)
+                            for cell, mine in is_mine.items()]))
+            stats.blocking_clauses += 1
+            stats.blocking_literals += len(is_mine)
+    finally:
+        stats.record_z3(sol)
+
 
-def solution_board(game, mines, mod):
+# -------------- INSTRUMENTATION ---------------- #
+
+class SolveStats:
+    """
+    Opt-in profile of one solve. Pass an instance as stats= to solve(),
+    enumerate_solutions() or SolverSession.solve() and it is filled in place.
+
+    - phases / calls: seconds spent in and number of runs of each phase
+      (build, check, model, eval, block)
+    - constraints: board constraints (numbers, known cells, mine count) asserted
+      before enumeration starts, counted as they are added: z3 does not list the
+      assertions of a QF_FD solver, and the int encoding's 0..1 bounds are left out
+      so both encodings count the same
+    - blocking_clauses / blocking_literals: growth of the blocking clauses
+    - solutions: models enumerated
+    - result: outcome of the last check (sat, unsat, unknown or timeout)
+    - reason: why z3 answered unknown (e.g. timeout, max. resource limit exceeded)
+    - z3: the solver's statistics() at the end (conflicts, decisions, memory, ...)
+    - trace: optional callable(phase, data) called as each phase finishes
+    """
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.phases = {}
+        self.calls = {}
+        self.constraints = 0
+        self.blocking_clauses = 0
+        self.blocking_literals = 0
+        self.solutions = 0
+        self.result = None
+        self.reason = None
+        self.z3 = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.trace is not None:
+                self.trace(name, {"seconds": elapsed, "solutions": self.solutions})
+
+    def record_z3(self, sol: Solver):
+        statistics = sol.statistics()
+        self.z3 = {key: statistics.get_key_value(key) for key in statistics.keys()}
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.phases.values())
+
+    def as_dict(self) -> dict:
+        """
+        The stats as plain JSON-ready values
+        """
+        return {
+            "seconds": self.seconds,
+            "phases": dict(self.phases),
+            "calls": dict(self.calls),
+            "constraints": self.constraints,
+            "blocking_clauses": self.blocking_clauses,
+            "blocking_literals": self.blocking_literals,
+            "solutions": self.solutions,
+            "result": self.result,
+            "reason": self.reason,
+            "z3": dict(self.z3),
+        }
+
+    def __repr__(self):
+        phases = ", ".join(f"{name}={seconds:.4f}s/{self.calls[name]}"
+                           for name, seconds in self.phases.items())
+        return (f"SolveStats({self.solutions} solutions, {self.constraints} constraints, "
+                f"result={self.result}, {phases})")
+
+
+class _NullStats(SolveStats):
+    """
+    Stands in when no stats are requested, so the solver pays nothing for them
+    """
+    trace = None
+    blocking_clauses = blocking_literals = solutions = 0
+
+    def __init__(self):
+        pass
+
+    def phase(self, name: str):
+        return contextlib.nullcontext()
+
+    def record_z3(self, sol: Solver):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_STATS = _NullStats()
+
+
+# -------------- BATCH SOLVING ---------------- #
+
+_worker_cache = None
+
+
+def _solve_worker(job):
+    # Runs in a pool process, which has its own z3 context (and its own cache)
+    global _worker_cache
+    index, board, kwargs, timeout, cache_dir = job
+    if cache_dir and (_worker_cache is None or _worker_cache.path != cache_dir):
+        _worker_cache = SolverCache(path=cache_dir)
+    if cache_dir:
+        found, result = _worker_cache.get("solve", board, kind="solutions", **kwargs)
+        if found:
+            return (index, *result, False)
+    stats = SolveStats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = solve(board, timeout=timeout, stats=stats, **kwargs)
+    # rlimit and max_memory stop z3 with "unknown"; either way the enumeration is partial
+    timed_out = stats.result in ("timeout", "unknown")
+    if cache_dir and not timed_out:
+        # a partial enumeration must not be served as the answer next time
+        _worker_cache.store("solve", board, result, kind="solutions", **kwargs)
+    return (index, *result, timed_out)
+
+
+def solve_many(boards, workers: int = None, timeout: float = None,
+               ordered: bool = True, cache_dir: str = None, **kwargs):
     """
-    Returns a solved board given the game board and the mines
+    Solves many boards across a process pool, yielding
+    (index, num_solutions, solutions, timed_out) for each board as it finishes.
+
+    Args:
+    - boards: an iterable of game boards
+    - workers (int): number of processes, defaults to the number of cores
+    - timeout (float): seconds allowed per board, after which its solutions so far are returned
+      (timed_out is also set when an rlimit or max_memory budget in kwargs stops the solve)
+    - ordered (bool): yield in input order; otherwise yield as soon as any board finishes
+    - cache_dir (str): on-disk SolverCache shared by the workers and across runs
+    - kwargs: passed on to solve()
+    """
+    jobs = ((index, board, kwargs, timeout, cache_dir)
+            for index, board in enumerate(boards))
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap if ordered else pool.imap_unordered
+        yield from results(_solve_worker, jobs)
+
+
+# -------------- INCREMENTAL SOLVING ---------------- #
+
+class _SessionVars(dict):
+    # cell -> variable, declaring a cell's variable the first time a constraint
+    # mentions it, so a session only holds the cells next to what was revealed.
+    # A cell already revealed on game is pinned to its value as it is declared
+    def __init__(self, sol: Solver, enc):
+        super().__init__()
+        self.sol = sol
+        self.enc = enc
+        self.game = None
+        self.pinned = 0  # constraints added by pinning, for SolveStats
+
+    def __missing__(self, cell):
+        i, j = cell
+        var = self[cell] = self.enc.declare(self.sol, f"mines_{i}_{j}")
+        if self.game[i][j] == MINE:
+            self.sol.add(self.enc.mine(var))
+            self.pinned += 1
+        elif self.game[i][j] > UNKNOWN:
+            self.sol.add(self.enc.safe(var))
+            self.pinned += 1
+        return var
+
+
+class SolverSession:
+    """
+    A z3 solver kept alive across the moves of one game.
+
+    Revealing a cell only adds that cell's constraints to the base solver, so the
+    clauses z3 learned on earlier calls are kept. As in build_sparse_solver(), only
+    the cells those constraints mention get a variable (and numbers with nothing
+    hidden around them add none); the interior stays one aggregate. Anything that can change between calls (the interior's share of the
+    mine count, blocking clauses) is asserted inside a push/pop scope. If a cell that
+    was already asserted changes (design mode, reset), the session rebuilds itself.
+    """
+
+    def __init__(self, rows: int, cols: int,
+                 mine_cnt: int = MINE_CNT,
+                 constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                 encoding: str = ENCODING):
+        self.rows = rows
+        self.cols = cols
+        self.mine_cnt = mine_cnt
+        self.constrain_mines = constrain_mines
+        self.enc = ENCODINGS[encoding]
+        self.reset()
+
+    def reset(self):
+        """
+        Drops every asserted cell and starts from a fresh solver
+        """
+        self.sol = self.enc.solver()
+        self.mines = _SessionVars(self.sol, self.enc)
+        # cell -> value whose constraints are asserted in the base solver
+        self.asserted = {}
+        self.constraints = 0
+
+    def update(self, game: List[List[int]], cells=None):
+        """
+        Asserts the constraints of every cell revealed since the last update.
+        Given cells, the batch revealed since then (see reveal_region), only those
+        are looked at instead of the whole board.
+        """
+        if cells is None:
+            if any(game[i][j] != value for (i, j), value in self.asserted.items()):
+                self.reset()
+            cells = [(i, j) for i in range(self.rows) for j in range(self.cols)]
+        self.mines.game = game
+        for i, j in cells:
+            if (i, j) in self.asserted:
+                if self.asserted[(i, j)] != game[i][j]:
+                    # an asserted cell changed, which only a full rebuild can undo
+                    self.reset()
+                    self.update(game)
+                    return
+                continue
+            if game[i][j] == UNKNOWN:
+                continue
+            if game[i][j] > UNKNOWN and all(game[r][c] != UNKNOWN for r, c in
+                                            neighbors(i, j, self.rows, self.cols)):
+                # nothing is hidden around this number, so its count holds as soon as
+                # its neighbors are pinned; only its own variable (if any) needs pinning
+                constraints = [self.enc.safe(self.mines[(i, j)])] if (i, j) in self.mines else []
+            else:
+                constraints = cell_constraints(game, self.mines, i, j, self.enc)
+            self.sol.add(constraints)
+            self.constraints += len(constraints)
+            self.asserted[(i, j)] = game[i][j]
+
+    def solve(self, game: List[List[int]],
+              blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+              limit_sols: bool = LIMIT_SOL_SPACE,
+              timeout: float = None,
+              stats: "SolveStats" = None,
+              cells=None):
+        """
+        Same result as solve() on the session's board, reusing the persistent solver
+        """
+        return collect_solutions(self.iter_solutions(game, blanks_no_adj, timeout, stats,
+                                                     cells), limit_sols)
+
+    def iter_solutions(self, game: List[List[int]],
+                       blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                       timeout: float = None,
+                       stats: "SolveStats" = None,
+                       cells=None):
+        """
+        Lazily yields the packed solutions of the session's board, like iter_solutions()
+        with sparse (z3 enumerates the frontier, complete_interior() the rest).
+        The timeout counts from the call, so it covers asserting the new cells too.
+        Exhaust or close() the generator before using the session again.
+        """
+        stats = stats or _NO_STATS
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with stats.phase("build"):
+            self.update(game, cells)
+            self.sol.push()
+        try:
+            with stats.phase("build"):
+                frontier = {}
+                interior = []
+                for i, row in enumerate(game):
+                    for j, value in enumerate(row):
+                        if value != UNKNOWN:
+                            continue
+                        if (i, j) in self.mines:
+                            frontier[(i, j)] = self.mines[(i, j)]
+                        elif not (blanks_no_adj and blank_has_no_info(game, i, j)):
+                            # a blank surrounded only by unknowns holds no mine
+                            interior.append((i, j))
+                known = pack_solution(game)
+                remaining = None
+                scoped = 0
+                if self.constrain_mines:
+                    remaining = self.mine_cnt - bin(known).count("1")
+                    if not frontier:
+                        self.sol.add(BoolVal(0 <= remaining <= len(interior)))
+                        scoped = 1
+                    else:
+                        self.sol.add(self.enc.at_most(list(frontier.values()), remaining))
+                        self.sol.add(self.enc.at_least(list(frontier.values()),
+                                                       remaining - len(interior)))
+                        scoped = 2
+            stats.constraints = self.constraints + self.mines.pinned + scoped
+            found = models(self.sol, game, frontier, self.enc, _time_left(deadline), stats)
+            try:
+                yield from complete_interior(found, interior, self.cols, known, remaining,
+                                             _time_left(deadline), stats)
+            finally:
+                found.close()
+        finally:
+            self.sol.pop()
+            if timeout is not None:
+                # the solver outlives this call, so lift the timeout again
+                self.sol.set("timeout", NO_TIMEOUT)
+
+
+# -------------- EXACT PROBABILITIES ---------------- #
+
+def neighbors(i: int, j: int, rows: int, cols: int) -> List[Tuple[int, int]]:
+    """
+    Returns the in-bounds cells adjacent to (i, j)
+    """
+    return [(i + a, j + b) for a in [-1, 0, 1] for b in [-1, 0, 1]
+            if (a != 0 or b != 0) and 0 <= i + a < rows and 0 <= j + b < cols]
+
+
+def frontier_constraints(game: List[List[int]], blanks_no_adj: bool = False):
+    """
+    Splits the board into the constraints on its frontier and the unconstrained interior.
+
+    Returns (constraints, interior, known_mines), where each constraint is a tuple of
+    (unknown neighbor cells, mines still needed among them), or None if a number on
+    the board can no longer be satisfied.
     """
     rows = len(game)
     cols = len(game[0])
-    board = [[0 for _ in range(cols)] for _ in range(rows)]
+
+    known_mines = sum(row.count(MINE) for row in game)
+    constraints = []
+    frontier = set()
+    for i, row in enumerate(game):
+        # rows without numbers are common on large boards and skipped whole
+        if row.count(UNKNOWN) + row.count(MINE) == cols:
+            continue
+        for j, value in enumerate(row):
+            if value <= UNKNOWN:
+                continue
+            cells = []
+            need = value
+            for r, c in neighbors(i, j, rows, cols):
+                if game[r][c] == MINE:
+                    need -= 1
+                elif game[r][c] <= UNKNOWN:
+                    cells.append((r, c))
+            if need < 0 or need > len(cells):
+                return None
+            if cells:
+                constraints.append((tuple(cells), need))
+                frontier.update(cells)
+
+    interior = []
+    frontier_rows = {i for i, _ in frontier}
+    for i, row in enumerate(game):
+        if not blanks_no_adj and i not in frontier_rows:
+            interior.extend([(i, j) for j, value in enumerate(row)
+                             if value <= UNKNOWN and value != MINE])
+            continue
+        for j, value in enumerate(row):
+            if value > UNKNOWN or value == MINE or (i, j) in frontier:
+                continue
+            # Mirrors solve(): a blank surrounded only by unknowns holds no mine
+            if blanks_no_adj and all(game[r][c] == UNKNOWN
+                                     for r, c in neighbors(i, j, rows, cols)):
+                continue
+            interior.append((i, j))
+
+    return constraints, interior, known_mines
+
+
+def frontier_components(constraints):
+    """
+    Groups the frontier constraints into independent components that share no cells.
+
+    Returns a list of (cells, constraints) pairs, with cells in breadth-first order
+    so neighboring cells are assigned close together during enumeration.
+    """
+    cell_cons = {}
+    for n, (cells, _) in enumerate(constraints):
+        for cell in cells:
+            cell_cons.setdefault(cell, []).append(n)
+
+    components = []
+    seen_cells = set()
+    seen_cons = set()
+    for start in sorted(cell_cons):
+        if start in seen_cells:
+            continue
+        order = [start]
+        seen_cells.add(start)
+        members = []
+        for cell in order:
+            for n in cell_cons[cell]:
+                if n in seen_cons:
+                    continue
+                seen_cons.add(n)
+                members.append(constraints[n])
+                for other in constraints[n][0]:
+                    if other not in seen_cells:
+                        seen_cells.add(other)
+                        order.append(other)
+        components.append((order, members))
+    return components
+
+
+def component_table(cells, constraints, timeout: float = None,
+                    max_states: int = None) -> Tuple[list, Dict[int, Tuple[int, List[int]]]]:
+    """
+    Counts the assignments of a single frontier component by mine count, together with
+    how many of them make each cell a mine, without listing them.
+
+    The layers of the counting sweep (see count_component) are walked forwards and
+    backwards: the assignments through a cell set to a mine are the ways to reach the
+    state before it times the ways to finish from the state after it.
+    Returns (cells in sweep order, table) where table maps a mine count k to
+    (number of assignments with k mines, per-cell number of those in which the cell
+    is a mine). Raises TimeoutError if it takes longer than timeout seconds or the
+    sweep visits more than max_states states.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    cells, states, layers = _sweep_component(cells, constraints, True, deadline, max_states)
+    per_cell = [{} for _ in cells]
+    # ways to finish the sweep from each state after cell n, by mines still to come
+    after = {(): {0: 1}}
+    for n in range(len(cells) - 1, -1, -1):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("component sweep ran out of time")
+        before, back = layers[n]
+        ahead = {}
+        for step, (key, rest) in enumerate(after.items()):
+            if (step & _DEADLINE_EVERY == _DEADLINE_EVERY and deadline is not None
+                    and time.perf_counter() > deadline):
+                raise TimeoutError("component sweep ran out of time")
+            for state, v in back.get(key, ()):
+                target = ahead.setdefault(state, {})
+                for k, count in rest.items():
+                    target[k + v] = target.get(k + v, 0) + count
+                if v:
+                    for k, count in _convolve(before[state], rest).items():
+                        per_cell[n][k + 1] = per_cell[n].get(k + 1, 0) + count
+        after = ahead
+
+    table = {}
+    for k, total in states.get((), {}).items():
+        table[k] = (total, [mines.get(k, 0) for mines in per_cell])
+    return cells, table
+
+
+def _component_table(cells, constraints, memo: dict, deadline: float, max_states: int):
+    # component_table(), through memo when there is one; tagged apart from the
+    # counts _component_counts() keeps in the same kind of memo
+    if memo is None:
+        return component_table(cells, constraints, _time_left(deadline), max_states)
+    key = ("table", tuple(cells), tuple(constraints))
+    if key not in memo:
+        memo[key] = component_table(cells, constraints, _time_left(deadline), max_states)
+    return memo[key]
+
+
+def _convolve(a: Dict[int, int], b: Dict[int, int]) -> Dict[int, int]:
+    out = {}
+    for ka, wa in a.items():
+        for kb, wb in b.items():
+            out[ka + kb] = out.get(ka + kb, 0) + wa * wb
+    return out
+
+
+def _deconvolve(a: Dict[int, int], b: Dict[int, int]) -> Dict[int, int]:
+    # the c with _convolve(b, c) == a, by long division from the fewest mines up; the
+    # counts in b are all positive, so its lowest one divides exactly
+    low = min(b)
+    out = {}
+    for k in range(min(a) - low, max(a) - max(b) + 1):
+        rest = a.get(k + low, 0) - sum(w * out.get(k + low - kb, 0)
+                                       for kb, w in b.items() if kb != low)
+        if rest:
+            out[k] = rest // b[low]
+    return out
+
+
+def _interior_ways(n_int: int, low: int, high: int, exact: bool = True) -> Dict[int, int]:
+    # comb(n_int, left) for low <= left <= high, stepped from one comb() call since
+    # each is slow on the interior of a large board. Without exact, they are all
+    # scaled by (low + 1) * ... * high / comb(n_int, low) instead, which keeps them
+    # whole and their ratios exact without the one huge comb()
+    low = max(low, 0)
+    high = min(high, n_int)
+    ways = {}
+    if low > high:
+        return ways
+    count = comb(n_int, low) if exact else prod(range(low + 1, high + 1))
+    for left in range(low, high + 1):
+        ways[left] = count
+        count = count * (n_int - left) // (left + 1)
+    return ways
+
+
+def mine_probabilities(game: List[List[int]],
+                       mine_cnt: int = MINE_CNT,
+                       blanks_no_adj: bool = False,
+                       constrain_mines: bool = True,
+                       timeout: float = None,
+                       max_states: int = None) -> List[List[float]]:
+    """
+    Computes the exact probability of every cell being a mine, taken uniformly over
+    all solutions of the board, without enumerating full-board models.
+
+    The frontier is split into independent components which are counted on their
+    own (see component_table), and the unconstrained interior is weighted binomially
+    against the remaining mine count. Returns None if the board has no solution, and
+    raises TimeoutError if it takes longer than timeout seconds (see
+    anytime_probabilities) or the sweep of a component visits more than max_states
+    states, a budget that unlike the timeout does not depend on the machine.
+    """
+    split = frontier_constraints(game, blanks_no_adj)
+    return _split_probabilities(game, split, mine_cnt, constrain_mines, timeout, max_states)
+
+
+def _split_probabilities(game: List[List[int]], split, mine_cnt: int, constrain_mines: bool,
+                         timeout: float, max_states: int = None) -> List[List[float]]:
+    # mine_probabilities() of a board already split by frontier_constraints()
+    if split is None:
+        return None
+    constraints, interior, known_mines = split
+    cell_probs = frontier_probabilities(constraints, interior, mine_cnt - known_mines,
+                                        constrain_mines, timeout, max_states)
+    if cell_probs is None:
+        return None
+
+    probs = [[1.0 if cell == MINE else 0.0 for cell in row] for row in game]
+    for (i, j), prob in cell_probs.items():
+        probs[i][j] = prob
+    return probs
+
+
+def frontier_probabilities(constraints, interior, remaining: int,
+                           constrain_mines: bool = True,
+                           timeout: float = None,
+                           max_states: int = None,
+                           memo: dict = None) -> Dict[Tuple[int, int], float]:
+    """
+    The engine behind mine_probabilities(): returns the mine probability of every
+    frontier and interior cell given the frontier constraints and the number of mines
+    still unplaced, or None if there is no solution. Components already counted in
+    memo (kept across calls, as in count_solutions()) are not swept again.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    components = [_component_table(cells, cons, memo, deadline, max_states)
+                  for cells, cons in frontier_components(constraints)]
+    tables = [table for _, table in components]
+    if any(not table for table in tables):
+        return None
+    dists = [{k: total for k, (total, _) in table.items()} for table in tables]
+    probs = {}
+
+    if not constrain_mines:
+        # Components are independent and every interior cell is a fair coin
+        for (cells, _), table in zip(components, tables):
+            total = sum(t for t, _ in table.values())
+            for x, cell in enumerate(cells):
+                probs[cell] = sum(per_cell[x] for _, per_cell in table.values()) / total
+        probs.update(dict.fromkeys(interior, 0.5))
+        return probs
+
+    # prefix[n] / suffix[n] hold the mine-count distribution of components before / after n
+    prefix = [{0: 1}]
+    for dist in dists:
+        prefix.append(_convolve(prefix[-1], dist))
+    suffix = [{0: 1}]
+    for dist in reversed(dists):
+        suffix.append(_convolve(suffix[-1], dist))
+    suffix.reverse()
+
+    # every number of mines the frontier can leave the interior, weighted by the ways
+    # to place them; only their ratios matter here
+    n_int = len(interior)
+    ways = _interior_ways(n_int, remaining - max(prefix[-1]) - 1, remaining, exact=False)
+
+    def interior_ways(k: int, cells: int = n_int) -> int:
+        # scaled by n_int (if there is an interior), so that comb(n_int - 1, left) =
+        # comb(n_int, left) * (n_int - left) / n_int with one cell set aside stays whole
+        left = remaining - k
+        if not 0 <= left <= cells:
+            return 0
+        if cells == n_int:
+            return ways[left] * max(n_int, 1)
+        return ways[left] * (n_int - left)
+
+    total = sum(w * interior_ways(k) for k, w in prefix[-1].items())
+    if total == 0:
+        return None
+
+    for n, ((cells, _), table) in enumerate(zip(components, tables)):
+        others = _convolve(prefix[n], suffix[n + 1])
+        weight = {k: sum(w * interior_ways(k + ko) for ko, w in others.items())
+                  for k in table}
+        for x, cell in enumerate(cells):
+            probs[cell] = sum(per_cell[x] * weight[k]
+                              for k, (_, per_cell) in table.items()) / total
+
+    if n_int:
+        interior_mines = sum(w * interior_ways(k + 1, n_int - 1)
+                             for k, w in prefix[-1].items())
+        # one division: the counts of large boards are huge ints
+        probs.update(dict.fromkeys(interior, interior_mines / total))
+
+    return probs
+
+
+def likely_mines_exact(probs: List[List[float]],
+                       init_board: List[List[int]]) -> Tuple[List[Tuple[int, int]], float]:
+    """
+    Returns the unknown cells most likely to be mines according to mine_probabilities()
+    """
+    unknown = [(i, j) for i, row in enumerate(init_board)
+               for j, cell in enumerate(row) if cell == UNKNOWN]
+    if not unknown:
+        return [], 1
+    top = max(probs[i][j] for i, j in unknown)
+    if top == 0:
+        return [], 1
+    return [(i, j) for i, j in unknown if probs[i][j] == top], top
+
+
+def likely_safe_exact(probs: List[List[float]],
+                      init_board: List[List[int]]) -> Tuple[List[Tuple[int, int]], float]:
+    """
+    Returns the unknown cells most likely to be safe according to mine_probabilities()
+    """
+    unknown = [(i, j) for i, row in enumerate(init_board)
+               for j, cell in enumerate(row) if cell == UNKNOWN]
+    if not unknown:
+        return [], 1
+    bottom = min(probs[i][j] for i, j in unknown)
+    if bottom == 1:
+        return [], 1
+    return [(i, j) for i, j in unknown if probs[i][j] == bottom], 1 - bottom
+
+
+# -------------- MODEL COUNTING ---------------- #
+
+def count_component(cells, constraints, timeout: float = None) -> Dict[int, int]:
+    """
+    Counts the assignments of a single frontier component by mine count, without
+    listing them.
+
+    Cells are assigned in order and the state only keeps the mines still needed by
+    the constraints that are open (partly assigned), so assignments that leave the
+    open constraints in the same state are merged and counted together.
+    Raises TimeoutError if it takes longer than timeout seconds.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    _, states, _ = _sweep_component(cells, constraints, deadline=deadline)
+    totals = {}
+    for dist in states.values():
+        for k, count in dist.items():
+            totals[k] = totals.get(k, 0) + count
+    return totals
+
+
+_DEADLINE_EVERY = 1023  # _sweep_component() checks its deadline every 1024 states
+
+
+def _sweep_component(cells, constraints, keep_layers: bool = False, deadline: float = None,
+                     max_states: int = None):
+    """
+    The sweep DP behind count_component(). Returns (cells in sweep order, final states,
+    layers), where with keep_layers layers[n] holds (states before cell n, the
+    (previous state, value of cell n) pairs leading to each state after it).
+    Raises TimeoutError once time.perf_counter() passes the deadline, or once more
+    than max_states states have been visited.
+    """
+    # Sweep column by column along the longer side so few constraints are open at once
+    height = max(i for i, _ in cells) - min(i for i, _ in cells)
+    width = max(j for _, j in cells) - min(j for _, j in cells)
+    cells = sorted(cells, key=lambda cell: (cell[1], cell[0]) if width >= height else cell)
+    index = {cell: n for n, cell in enumerate(cells)}
+    members = [sorted(index[cell] for cell in con_cells) for con_cells, _ in constraints]
+    cell_cons = [[] for _ in cells]
+    for c, con_cells in enumerate(members):
+        for n in con_cells:
+            cell_cons[n].append(c)
+
+    open_cons = []
+    # state: tuple of needs aligned with open_cons -> {mines so far: count}
+    states = {(): {0: 1}}
+    layers = []
+    visited = 0
+    for n in range(len(cells)):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("component sweep ran out of time")
+        visited += len(states)
+        if max_states is not None and visited > max_states:
+            raise TimeoutError("component sweep ran out of states")
+        new_open = list(open_cons)
+        for c in cell_cons[n]:
+            if c not in new_open:
+                new_open.append(c)
+        closing = {c for c in cell_cons[n] if members[c][-1] == n}
+        kept = [c for c in new_open if c not in closing]
+        position = {c: x for x, c in enumerate(new_open)}
+
+        new_states = {}
+        back = {}
+        for step, (state, dist) in enumerate(states.items()):
+            if (step & _DEADLINE_EVERY == _DEADLINE_EVERY and deadline is not None
+                    and time.perf_counter() > deadline):
+                # one cell's layer can hold millions of states on a large component
+                raise TimeoutError("component sweep ran out of time")
+            base = list(state) + [constraints[c][1] for c in new_open[len(open_cons):]]
+            for v in (0, 1):
+                needs = list(base)
+                ok = True
+                for c in cell_cons[n]:
+                    x = position[c]
+                    needs[x] -= v
+                    left = len(members[c]) - bisect_right(members[c], n)
+                    if needs[x] < 0 or needs[x] > left:
+                        ok = False
+                        break
+                if not ok:
+                    continue
+                key = tuple(needs[position[c]] for c in kept)
+                target = new_states.setdefault(key, {})
+                for k, count in dist.items():
+                    target[k + v] = target.get(k + v, 0) + count
+                if keep_layers:
+                    back.setdefault(key, []).append((state, v))
+        if keep_layers:
+            layers.append((states, back))
+        states = new_states
+        open_cons = kept
+
+    return cells, states, layers
+
+
+def count_solutions(game: List[List[int]],
+                    mine_cnt: int = MINE_CNT,
+                    blanks_no_adj: bool = BLANKS_HAVE_NO_NEW_INFO,
+                    constrain_mines: bool = CONSTRAIN_CORRECT_MINE_COUNT,
+                    memo: dict = None,
+                    timeout: float = None) -> int:
+    """
+    Returns the exact number of solutions solve() would enumerate with no limit,
+    computed by counting each frontier component and weighting the interior
+    combinatorially instead of listing models.
+    Components already counted in memo (a dict kept across calls on positions of
+    the same game) are not counted again. Raises TimeoutError if it takes longer
+    than timeout seconds.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    split = frontier_constraints(game, blanks_no_adj)
+    if split is None:
+        return 0
+    constraints, interior, known_mines = split
+    combined = {0: 1}
+    for cells, cons in frontier_components(constraints):
+        combined = _convolve(combined, _component_counts(cells, cons, memo, deadline))
+    return _place_interior(combined, len(interior), mine_cnt - known_mines, constrain_mines)
+
+
+def _component_counts(cells, constraints, memo: dict, deadline: float) -> Dict[int, int]:
+    # count_component(), through memo when there is one
+    if memo is None:
+        return count_component(cells, constraints, _time_left(deadline))
+    key = (tuple(cells), tuple(constraints))
+    if key not in memo:
+        memo[key] = count_component(cells, constraints, _time_left(deadline))
+    return memo[key]
+
+
+def _place_interior(frontier: Dict[int, int], n_int: int, remaining: int,
+                    constrain_mines: bool, ways: Dict[int, int] = None) -> int:
+    # the solutions of a board from the distribution of its frontier's mine counts,
+    # with the interior filled in every way that fits; ways is _interior_ways() over
+    # at least the counts the frontier can leave, for callers that share it
+    if not frontier:
+        return 0
+    if not constrain_mines:
+        return sum(frontier.values()) << n_int
+    if ways is None:
+        ways = _interior_ways(n_int, remaining - max(frontier), remaining - min(frontier))
+    return sum(count * ways.get(remaining - k, 0) for k, count in frontier.items())
+
+
+# -------------- SAMPLING ---------------- #
+
+class SolutionSampler:
+    """
+    Draws solutions of a board approximately uniformly, for boards too large to count
+    exactly (see mine_probabilities()).
+
+    A Markov chain walks over the frontier configurations. It starts from one z3 model
+    of the frontier, and every step redraws a window of up to SAMPLE_WINDOW connected
+    frontier cells from their exact distribution given the cells around them, counted
+    with the sweep of count_component() (which a window keeps small) and weighted by
+    the ways to place the leftover mines in the interior. Nothing is ever counted over
+    a whole component, so the cost of a step does not grow with the board.
+
+    Each draw() takes steps window updates (by default enough to cover the frontier
+    once) and scatters the leftover mines over the interior, so consecutive draws are
+    correlated and only uniform in the limit.
+    """
+
+    def __init__(self, game: List[List[int]],
+                 mine_cnt: int = MINE_CNT,
+                 blanks_no_adj: bool = False,
+                 constrain_mines: bool = True,
+                 rng: random.Random = None,
+                 timeout: float = None,
+                 steps: int = None,
+                 encoding: str = ENCODING):
+        self.rows = len(game)
+        self.cols = len(game[0])
+        self.constrain_mines = constrain_mines
+        self.rng = rng or random.Random()
+        self.solvable = False
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        split = frontier_constraints(game, blanks_no_adj)
+        if split is None:
+            return
+        self.constraints, self.interior, known_mines = split
+        self.remaining = mine_cnt - known_mines
+        self.known = pack_solution(game)
+        self.cell_cons = {}
+        for c, (cells, _) in enumerate(self.constraints):
+            for cell in cells:
+                self.cell_cons.setdefault(cell, []).append(c)
+        self.frontier = sorted(self.cell_cons)
+        self.steps = steps or -(-len(self.frontier) // SAMPLE_WINDOW)
+
+        start = self._start(encoding, _time_left(deadline))
+        if start is None:
+            return
+        self.mines = start
+        self.solvable = True
+        # burn in from the z3 model, as far as the budget allows
+        for _ in range(self.steps):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            self._step()
+
+    def _start(self, encoding: str, timeout: float):
+        # the frontier mines of one solution, found by z3, or None without any;
+        # raises TimeoutError if z3 cannot tell within the timeout
+        enc = ENCODINGS[encoding]
+        n_int = len(self.interior)
+        if not self.frontier:
+            fits = not self.constrain_mines or 0 <= self.remaining <= n_int
+            return set() if fits else None
+        sol = enc.solver()
+        var = {(i, j): enc.declare(sol, f"mines_{i}_{j}") for i, j in self.frontier}
+        for cells, need in self.constraints:
+            sol.add(enc.exactly([var[cell] for cell in cells], need))
+        if self.constrain_mines:
+            total = list(var.values())
+            sol.add(enc.at_most(total, self.remaining),
+                    enc.at_least(total, self.remaining - n_int))
+        if timeout is not None:
+            sol.set("timeout", max(1, int(timeout * 1000)))
+        result = sol.check()
+        if result == unknown:
+            raise TimeoutError("no starting solution within the timeout")
+        if result != sat:
+            return None
+        mod = sol.model()
+        return {cell for cell in self.frontier if enc.is_mine(mod, var[cell])}
+
+    def _pick(self, options):
+        # options: list of (item, weight) with integer weights
+        point = self.rng.randrange(sum(weight for _, weight in options))
+        for item, weight in options:
+            if point < weight:
+                return item
+            point -= weight
+
+    def _window(self) -> List[Tuple[int, int]]:
+        # breadth-first from a random frontier cell, through shared constraints
+        start = self.rng.choice(self.frontier)
+        window = [start]
+        seen = {start}
+        for cell in window:
+            for c in self.cell_cons[cell]:
+                for other in self.constraints[c][0]:
+                    if other not in seen:
+                        if len(window) == SAMPLE_WINDOW:
+                            return window
+                        seen.add(other)
+                        window.append(other)
+        return window
+
+    def _step(self):
+        # redraws the cells of one window given every other frontier cell
+        window = self._window()
+        inside = set(window)
+        cons = []
+        for c in {c for cell in window for c in self.cell_cons[cell]}:
+            cells, need = self.constraints[c]
+            outside = sum(cell in self.mines for cell in cells if cell not in inside)
+            cons.append((tuple(cell for cell in cells if cell in inside), need - outside))
+        cells, states, layers = _sweep_component(window, cons, True)
+        # the current assignment of the window fits, so dist is never empty
+        dist = states[()]
+        placed = len(self.mines) - len(self.mines & inside)
+        if self.constrain_mines:
+            left = self.remaining - placed
+            ways = _interior_ways(len(self.interior), left - max(dist), left - min(dist),
+                                  exact=False)
+            options = [(k, w * ways.get(left - k, 0)) for k, w in dist.items()]
+        else:
+            options = list(dist.items())
+        k = self._pick([(k, w) for k, w in options if w])
+
+        self.mines -= inside
+        key = ()
+        for x in range(len(cells) - 1, -1, -1):
+            before, back = layers[x]
+            key, v = self._pick([((state, v), before[state].get(k - v, 0))
+                                 for state, v in back[key]])
+            if v:
+                self.mines.add(cells[x])
+                k -= 1
+
+    def draw(self) -> int:
+        """
+        Returns one solution, packed as in pack_solution()
+        """
+        if not self.solvable:
+            raise ValueError("the board has no solution")
+        for _ in range(self.steps):
+            self._step()
+        if self.constrain_mines:
+            interior = self.rng.sample(self.interior, self.remaining - len(self.mines))
+        else:
+            interior = [cell for cell in self.interior if self.rng.random() < 0.5]
+        # set the bits in a bitstring, as place_mines() does
+        bits = bytearray(b"0" * (self.rows * self.cols))
+        for i, j in itertools.chain(self.mines, interior):
+            bits[-1 - (i * self.cols + j)] = 49  # "1"
+        return self.known | int(bits, 2) if bits else self.known
+
+
+def sample_probabilities(game: List[List[int]],
+                         mine_cnt: int = MINE_CNT,
+                         blanks_no_adj: bool = False,
+                         constrain_mines: bool = True,
+                         tolerance: float = 0.02,
+                         confidence: float = 0.95,
+                         batch: int = 50,
+                         max_samples: int = 20000,
+                         timeout: float = None,
+                         rng: random.Random = None):
+    """
+    Estimates the mine probability of every cell from the draws of a SolutionSampler,
+    drawing batches until every unknown cell's confidence interval is within tolerance.
+
+    The draws come from a Markov chain, so they are correlated and count for fewer
+    independent samples than they are. The spread of the batch means gives each cell's
+    effective sample size, and the intervals are only trusted after SAMPLE_BATCHES
+    batches.
+
+    Returns (probs, errors, samples), where errors holds the half-width of each cell's
+    Wilson score interval at the given confidence, taken over its effective sample
+    size, or None if the board has no solution.
+    With a timeout, stops early with the samples drawn so far; raises TimeoutError if
+    the sampler could not be built in time.
+    """
+    rows = len(game)
+    cols = len(game[0])
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    sampler = SolutionSampler(game, mine_cnt, blanks_no_adj, constrain_mines, rng,
+                              _time_left(deadline))
+    if not sampler.solvable:
+        return None
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    unknown = [i * cols + j for i in range(rows) for j in range(cols) if game[i][j] == UNKNOWN]
+    counts = [0] * (rows * cols)
+    # per unknown cell, the sum and the sum of squares of its counts in full batches
+    sums = dict.fromkeys(unknown, 0)
+    squares = dict.fromkeys(unknown, 0)
+    batches = 0
+    n = 0
+    while True:
+        drawn = []
+        for _ in range(min(batch, max_samples - n)):
+            drawn.append(sampler.draw())
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        n += len(drawn)
+        found = mine_counts(drawn, rows * cols)
+        counts = [total + count for total, count in zip(counts, found)]
+        if len(drawn) == batch:
+            batches += 1
+            for cell in unknown:
+                sums[cell] += found[cell]
+                squares[cell] += found[cell] * found[cell]
+
+        def half_width(cell: int) -> float:
+            p = counts[cell] / n
+            m = n
+            if batches > 1:
+                mean = sums[cell] / batches
+                spread = (squares[cell] - batches * mean * mean) / (batches - 1)
+                if spread > 0:
+                    # n independent draws would give batch counts a variance of
+                    # batch * p * (1 - p); correlated ones spread further
+                    m = min(n, p * (1 - p) * batch * batch * batches / spread)
+            return z / (1 + z * z / m) * (p * (1 - p) / m + z * z / (4 * m * m)) ** 0.5
+
+        worst = max((half_width(cell) for cell in unknown), default=0)
+        if ((worst <= tolerance and batches >= SAMPLE_BATCHES) or n >= max_samples
+                or (deadline is not None and time.perf_counter() >= deadline)):
+            break
+
+    probs = [[counts[i * cols + j] / n for j in range(cols)] for i in range(rows)]
+    errors = [[half_width(i * cols + j) if game[i][j] == UNKNOWN else 0.0
+               for j in range(cols)] for i in range(rows)]
+    return probs, errors, n
+
+
+def anytime_probabilities(game: List[List[int]],
+                          mine_cnt: int = MINE_CNT,
+                          constrain_mines: bool = True,
+                          timeout: float = 1.0,
+                          rng: random.Random = None):
+    """
+    Mine probabilities within a wall-clock budget, returning the best answer found in
+    time instead of blocking: the cells propagate() proves first, then the exact
+    probabilities if they finish within half of what is left, else sampled estimates
+    (drawn with rng), else the plain mine density over the undecided cells.
+
+    Returns (probs, safe cells, mine cells, method) with method one of "exact",
+    "sampled" or "density", or None if the board has no solution.
+    """
+    rows = len(game)
+    cols = len(game[0])
+    deadline = time.perf_counter() + timeout
+    decided = propagate(game, mine_cnt, constrain_mines)
+    if decided is None:
+        return None
+    safe, mines, _ = decided
+
+    try:
+        probs = mine_probabilities(game, mine_cnt, False, constrain_mines,
+                                   (deadline - time.perf_counter()) / 2)
+        method = "exact"
+    except TimeoutError:
+        try:
+            sampled = sample_probabilities(game, mine_cnt, False, constrain_mines,
+                                           timeout=deadline - time.perf_counter(), rng=rng)
+            probs = None if sampled is None else sampled[0]
+            method = "sampled"
+        except TimeoutError:
+            undecided = [(i, j) for i in range(rows) for j in range(cols)
+                         if game[i][j] == UNKNOWN and (i, j) not in safe and (i, j) not in mines]
+            known = sum(row.count(MINE) for row in game) + len(mines)
+            density = (mine_cnt - known) / len(undecided) if constrain_mines and undecided else 0.5
+            probs = [[1.0 if game[i][j] == MINE else 0.0 for j in range(cols)]
+                     for i in range(rows)]
+            for i, j in undecided:
+                probs[i][j] = density
+            method = "density"
+    if probs is None:
+        return None
+
+    for i, j in safe:
+        probs[i][j] = 0.0
+    for i, j in mines:
+        probs[i][j] = 1.0
+    return probs, safe, mines, method
+
+
+# -------------- PROPAGATION ---------------- #
+
+def propagate(game: List[List[int]],
+              mine_cnt: int = MINE_CNT,
+              constrain_mines: bool = False,
+              split=None):
+    """
+    Decides cells with local rules only, without invoking z3:
+    - a number whose mines are all found makes its other unknown neighbors safe
+    - a number equal to its count of unknown neighbors makes them all mines
+    - if one number's unknown neighbors are a subset of another's, the difference
+      is decided the same way
+    - with constrain_mines, the global mine count can decide every leftover cell
+
+    Returns (safe cells, mine cells, leftover frontier constraints), or None if the
+    board has no solution. split is frontier_constraints(game), for callers that keep
+    it up to date as the board changes (see solvable()).
+    """
+    split = frontier_constraints(game) if split is None else split
+    if split is None:
+        return None
+    constraints, interior, known_mines = split
+    cons = [[set(cells), need] for cells, need in constraints]
+    unknown = set(interior).union(*[cells for cells, _ in cons])
+    safe = set()
+    mines = set()
+
+    def rule(cells, need, pending) -> bool:
+        # Records the cells a (cells, need) constraint decides, False on a contradiction
+        if need < 0 or need > len(cells):
+            return False
+        if need == 0 or need == len(cells):
+            for cell in cells:
+                if pending.setdefault(cell, need > 0) != (need > 0):
+                    return False
+        return True
+
+    while True:
+        pending = {}
+        for cells, need in cons:
+            if not rule(cells, need, pending):
+                return None
+
+        if not pending:
+            cell_cons = {}
+            for n, (cells, _) in enumerate(cons):
+                for cell in cells:
+                    cell_cons.setdefault(cell, []).append(n)
+            for n, (cells, need) in enumerate(cons):
+                for m in set().union(*[cell_cons[cell] for cell in cells]):
+                    other, other_need = cons[m]
+                    if m != n and cells <= other:
+                        if not rule(other - cells, other_need - need, pending):
+                            return None
+
+        if not pending and constrain_mines:
+            undecided = unknown - safe - mines
+            if not rule(undecided, mine_cnt - known_mines - len(mines), pending):
+                return None
+
+        if not pending:
+            break
+        for cell, is_mine in pending.items():
+            (mines if is_mine else safe).add(cell)
+        for con in cons:
+            decided = con[0] & pending.keys()
+            con[0] -= decided
+            con[1] -= sum(pending[cell] for cell in decided)
+        cons = [con for con in cons if con[0]]
+
+    leftover = [(tuple(sorted(cells)), need) for cells, need in cons]
+    return safe, mines, leftover
+
+
+def certain_cells(game: List[List[int]],
+                  mine_cnt: int = MINE_CNT,
+                  constrain_mines: bool = False,
+                  encoding: str = ENCODING,
+                  decided=None,
+                  split=None,
+                  memo: dict = None):
+    """
+    Returns (safe cells, mine cells) that are the same in every solution of the board,
+    or None if it has none.
+
+    propagate() decides what it can first. The constraints left over on the undecided
+    frontier are then counted (see frontier_probabilities()), unless a component's
+    sweep needs more than CERTAIN_STATES states; then z3 sees only those constraints,
+    and every model it finds rules out more candidate cells.
+
+    Callers that already have them can pass the propagate() result as decided and
+    frontier_constraints(game) as split, and a memo of component counts kept across
+    calls on positions of the same game (see solvable()).
+    """
+    split = frontier_constraints(game) if split is None else split
+    result = propagate(game, mine_cnt, constrain_mines, split) if decided is None else decided
+    if split is None or result is None:
+        return None
+    safe, mines, leftover = result
+    safe, mines = set(safe), set(mines)
+    interior = [cell for cell in split[1] if cell not in safe and cell not in mines]
+    remaining = mine_cnt - split[2] - len(mines)
+
+    frontier = sorted({cell for cells, _ in leftover for cell in cells})
+    if not frontier:
+        return safe, mines
+
+    try:
+        # with memo, only the components that changed are swept again
+        probs = frontier_probabilities(leftover, interior, remaining, constrain_mines,
+                                       max_states=CERTAIN_STATES, memo=memo)
+    except TimeoutError:
+        probs = False
+    if probs is None:
+        return None
+    if probs:
+        safe.update(cell for cell, prob in probs.items() if prob == 0)
+        mines.update(cell for cell, prob in probs.items() if prob == 1)
+        return safe, mines
+
+    enc = ENCODINGS[encoding]
+    sol = enc.solver()
+    var = {(i, j): enc.declare(sol, f"mines_{i}_{j}") for i, j in frontier}
+    for cells, need in leftover:
+        sol.add(enc.exactly([var[cell] for cell in cells], need))
+    if constrain_mines:
+        total = [var[cell] for cell in frontier]
+        sol.add(enc.at_most(total, remaining),
+                enc.at_least(total, remaining - len(interior)))
+    if sol.check() != sat:
+        return None
+
+    mod = sol.model()
+    candidates = {cell: enc.is_mine(mod, var[cell]) for cell in frontier}
+    for cell in frontier:
+        if cell not in candidates:
+            continue
+        is_mine = candidates.pop(cell)
+        sol.push()
+        sol.add(enc.differs(var[cell], is_mine))
+        if sol.check() == unsat:
+            (mines if is_mine else safe).add(cell)
+        else:
+            # every cell that flips in this model cannot be certain either
+            mod = sol.model()
+            for other in list(candidates):
+                if enc.is_mine(mod, var[other]) != candidates[other]:
+                    del candidates[other]
+        sol.pop()
+
+    if constrain_mines and interior:
+        total = [var[cell] for cell in frontier]
+        for is_mine, bound in ((False, enc.at_most(total, remaining - 1)),
+                               (True, enc.at_least(total, remaining - len(interior) + 1))):
+            sol.push()
+            sol.add(bound)
+            if sol.check() == unsat:
+                (mines if is_mine else safe).update(interior)
+            sol.pop()
+
+    return safe, mines
+
+
+# -------------- BEST MOVE ---------------- #
+
+def number_distribution(game: List[List[int]], i: int, j: int,
+                        mine_cnt: int = MINE_CNT,
+                        constrain_mines: bool = True,
+                        memo: dict = None,
+                        timeout: float = None) -> Dict[int, int]:
+    """
+    Returns, for every number the unknown cell (i, j) could show once revealed, the
+    number of solutions in which it is safe and shows that number. The counts add up
+    to the solutions in which (i, j) is safe. memo works as in count_solutions(), and
+    the timeout (seconds) covers all the numbers together.
+
+    The board is split into its frontier once, and each number only recounts the
+    components next to (i, j).
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    split = frontier_constraints(game)
+    if split is None:
+        return {}
+    return _reveal_counts(game, i, j, _frontier_index(split, memo, deadline), mine_cnt,
+                          constrain_mines, memo, deadline)
+
+
+def _frontier_index(split, memo: dict, deadline: float):
+    # what _reveal_counts() needs from a position, worked out once for all its cells:
+    # the frontier components, their counts and combined distribution, the component
+    # of every frontier cell, and the interior
+    constraints, interior, known_mines = split
+    components = frontier_components(constraints)
+    dists = [_component_counts(cells, cons, memo, deadline) for cells, cons in components]
+    combined = {0: 1}
+    for dist in dists:
+        combined = _convolve(combined, dist)
+    owner = {cell: n for n, (cells, _) in enumerate(components) for cell in cells}
+    return components, dists, combined, owner, set(interior), known_mines
+
+
+def _reveal_counts(game: List[List[int]], i: int, j: int, index, mine_cnt: int,
+                   constrain_mines: bool, memo: dict, deadline: float,
+                   exact: bool = True) -> Dict[int, int]:
+    # number_distribution() on a position indexed by _frontier_index(): revealing
+    # (i, j) only changes the components it or its unknown neighbors belong to, so
+    # those are taken out of the combined distribution and counted again with (i, j)
+    # safe and showing each number. Without exact, the counts share a common factor
+    # (see _interior_ways()), enough for their ratios
+    components, dists, combined, owner, interior, known_mines = index
+    if not combined:
+        return {}
+    around = neighbors(i, j, len(game), len(game[0]))
+    hidden = tuple((r, c) for r, c in around if game[r][c] == UNKNOWN)
+    known = sum(game[r][c] == MINE for r, c in around)
+    touched = sorted({owner[cell] for cell in ((i, j),) + hidden if cell in owner})
+
+    kept = []
+    for n in touched:
+        for cells, need in components[n][1]:
+            cells = tuple(cell for cell in cells if cell != (i, j))
+            if cells:
+                kept.append((cells, need))
+            elif need:
+                # (i, j) is a mine in every solution
+                return {}
+    rest = combined
+    for n in touched:
+        rest = _deconvolve(rest, dists[n])
+
+    frontiers = {}
+    for number in range(known, known + len(hidden) + 1):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("move search ran out of time")
+        frontier = rest
+        cons = kept + [(hidden, number - known)] if hidden else kept
+        for cells, component in frontier_components(cons):
+            frontier = _convolve(frontier, _component_counts(cells, component, memo, deadline))
+        if frontier:
+            frontiers[number] = frontier
+
+    n_int = len(interior) - ((i, j) in interior) - sum(cell in interior for cell in hidden)
+    remaining = mine_cnt - known_mines
+    ways = None
+    if constrain_mines and frontiers:
+        low = min(min(frontier) for frontier in frontiers.values())
+        high = max(max(frontier) for frontier in frontiers.values())
+        ways = _interior_ways(n_int, remaining - high, remaining - low, exact)
+    counts = {}
+    for number, frontier in frontiers.items():
+        count = _place_interior(frontier, n_int, remaining, constrain_mines, ways)
+        if count:
+            counts[number] = count
+    return counts
+
+
+def best_moves(game: List[List[int]],
+               mine_cnt: int = MINE_CNT,
+               constrain_mines: bool = True,
+               depth: int = 1,
+               timeout: float = 1.0,
+               width: int = MOVE_WIDTH,
+               table: dict = None):
+    """
+    Ranks the unknown cells of a board as the next move, best first.
+
+    Every cell is scored by its probability of being safe. The width safest are also
+    scored by their information gain (entropy, in bits, of the number they would
+    show) and by their win probability: the chance of surviving this move and then
+    the best move of each position it can lead to, looking depth moves ahead.
+    Deeper searches run one after another (iterative deepening) until the timeout,
+    and the deepest finished one is returned; with no timeout the search always
+    reaches depth, so the ranking does not depend on the machine. Positions are kept
+    in table, keyed by canonical_board() so mirrored positions are searched once,
+    next to the counts of the frontier components they share; pass the same dict to
+    later calls on the same game to reuse both.
+
+    Returns (moves, searched depth) where moves is a list of
+    ((i, j), win probability, safe probability, information gain), sorted by win
+    probability then information gain, or None if the board has no solution.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    table = {} if table is None else table
+    table.setdefault("components", {})
+    split = frontier_constraints(game)
+    try:
+        probs = _split_probabilities(game, split, mine_cnt, constrain_mines,
+                                     None if timeout is None else timeout / 2)
+    except TimeoutError:
+        # too large to count in time, fall back to the best estimate and no search
+        estimate = anytime_probabilities(game, mine_cnt, constrain_mines,
+                                         max(deadline - time.perf_counter(), 0))
+        if estimate is None:
+            return None
+        probs = estimate[0]
+        return _rank_moves(game, probs, [], []), 0
+    if probs is None:
+        return None
+
+    scored, searched = None, 0
+    board = [row[:] for row in game]
+    candidates = []
+    for level in range(depth + 1):
+        try:
+            if level == 0:
+                index = _frontier_index(split, table["components"], deadline)
+                candidates = _candidates(board, probs, width, index)
+            deeper = _score_moves(board, probs, index, candidates, mine_cnt,
+                                  constrain_mines, level, width, deadline, table)
+        except TimeoutError:
+            break
+        scored, searched = deeper, level
+    if scored is None:
+        return _rank_moves(game, probs, [], []), searched
+    return _rank_moves(game, probs, scored, candidates), searched
+
+
+def _rank_moves(game: List[List[int]], probs: List[List[float]], scored, candidates):
+    # the scored candidates come first; the other cells follow by safe probability,
+    # which stands in for their (unsearched) win probability
+    skip = set(candidates)
+    # grouped rather than sorted: a large board has few distinct probabilities, and
+    # each group is already in cell order
+    groups = {}
+    for i, (row, prob_row) in enumerate(zip(game, probs)):
+        for j, (cell, prob) in enumerate(zip(row, prob_row)):
+            if cell == UNKNOWN and (i, j) not in skip:
+                groups.setdefault(1 - prob, []).append((i, j))
+    rank = sorted(scored, key=lambda move: (-move[1], -move[3], move[0]))
+    return rank + [(cell, safe, safe, 0.0) for safe in sorted(groups, reverse=True)
+                   for cell in groups[safe]]
+
+
+def _candidates(game: List[List[int]], probs: List[List[float]], width: int, index):
+    # safest cells first; among equals, the ones with fewer unknown neighbors, whose
+    # number is more likely to settle something
+    rows = len(game)
+    cols = len(game[0])
+    owner, interior = index[3], index[4]
+
+    def hidden_around(cell):
+        return sum(game[r][c] == UNKNOWN for r, c in neighbors(*cell, rows, cols))
+
+    # every interior cell has the same probability, and away from the edge and the
+    # mines it has all 8 neighbors unknown, so only the first width of those can be
+    # picked: the rest of a large interior is never looked at
+    edge = [(i, j) for i in range(rows) for j in (0, cols - 1)] + \
+        [(i, j) for i in (0, rows - 1) for j in range(cols)]
+    mines = [(i, j) for i, row in enumerate(game) if MINE in row
+             for j, cell in enumerate(row) if cell == MINE]
+    special = set(owner).union(edge, *(neighbors(*mine, rows, cols) for mine in mines))
+    cells = [cell for cell in special if game[cell[0]][cell[1]] == UNKNOWN]
+    if interior:
+        plain = (cell for cell in itertools.product(range(rows), range(cols))
+                 if cell in interior and cell not in special)
+        cells.extend(itertools.islice(plain, width))
+    cells = [(i, j) for i, j in cells if probs[i][j] < 1]
+
+    # 8 unknown neighbors bounds every cell, so the width safest with that bound leave
+    # out the cells that cannot be picked before any neighbors are counted
+    bound = heapq.nsmallest(width, ((probs[i][j], 8, (i, j)) for i, j in cells))
+    if not bound:
+        return []
+    keys = {cell: (prob, hidden) for prob, hidden, cell in bound}
+    for i, j in cells:
+        if (i, j) in special and probs[i][j] <= bound[-1][0]:
+            keys[(i, j)] = (probs[i][j], hidden_around((i, j)))
+    return sorted(keys, key=lambda cell: (*keys[cell], cell))[:width]
+
+
+def _score_moves(game: List[List[int]], probs: List[List[float]], index, candidates,
+                 mine_cnt: int, constrain_mines: bool, depth: int, width: int, deadline: float,
+                 table: dict):
+    # depth 0 scores the candidates by survival and information gain only; index is
+    # the position's _frontier_index(), shared by all of them. Returns the scored
+    # moves unranked, see _rank_moves()
+    scored = []
+    for i, j in candidates:
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("move search ran out of time")
+        # only the ratios of the counts are used
+        counts = _reveal_counts(game, i, j, index, mine_cnt, constrain_mines,
+                                table["components"], deadline, exact=False)
+        safe_total = sum(counts.values())
+        if not safe_total:
+            continue
+        info = sum(count / safe_total * log2(safe_total / count) for count in counts.values())
+        safe = 1 - probs[i][j]
+        win = safe
+        if depth > 0:
+            win = 0.0
+            for number, count in counts.items():
+                game[i][j] = number
+                try:
+                    win += count / safe_total * _position_value(
+                        game, mine_cnt, constrain_mines, depth - 1, width, deadline, table)
+                finally:
+                    game[i][j] = UNKNOWN
+            win *= safe
+        scored.append(((i, j), win, safe, info))
+    return scored
+
+
+def _position_value(game: List[List[int]], mine_cnt: int, constrain_mines: bool,
+                    depth: int, width: int, deadline: float, table: dict) -> float:
+    # win probability of the best move from a position, looking depth moves ahead
+    key = (canonical_board(game)[0], mine_cnt, constrain_mines, depth, width)
+    if key in table:
+        return table[key]
+    if deadline is not None and time.perf_counter() > deadline:
+        raise TimeoutError("move search ran out of time")
+    split = frontier_constraints(game)
+    probs = _split_probabilities(game, split, mine_cnt, constrain_mines, _time_left(deadline))
+    if probs is None:
+        value = 0.0
+    elif all(probs[i][j] == 1 for i, row in enumerate(game)
+             for j, cell in enumerate(row) if cell == UNKNOWN):
+        # only mines are left hidden: the game is won
+        value = 1.0
+    else:
+        index = _frontier_index(split, table["components"], deadline)
+        candidates = _candidates(game, probs, width, index)
+        scored = _score_moves(game, probs, index, candidates, mine_cnt, constrain_mines,
+                              depth, width, deadline, table)
+        if scored:
+            # the best move is all that counts, not the rest of the ranking
+            value = max(win for _, win, _, _ in scored)
+        else:
+            value = _rank_moves(game, probs, [], candidates)[0][1]
+    table[key] = value
+    return value
+
+
+# ------------- PACKED SOLUTIONS ---------------- #
+
+def pack_solution(board: List[List[int]]) -> int:
+    """
+    Packs a solved board into an int whose bit i * cols + j is set if (i, j) is a mine
+    """
+    cols = len(board[0])
+    return sum(1 << (i * cols + j) for i, row in enumerate(board)
+               for j, cell in enumerate(row) if cell == MINE)
+
+
+def unpack_solution(solution: int, game: List[List[int]]) -> List[List[int]]:
+    """
+    Expands a packed solution back into a board, filling the non-mines from game
+    """
+    cols = len(game[0])
+    return [[MINE if solution >> (i * cols + j) & 1 else cell
+             for j, cell in enumerate(row)] for i, row in enumerate(game)]
+
+
+def mine_counts(solutions: List[int], cells: int) -> List[int]:
+    """
+    Returns, for every cell, the number of packed solutions in which it is a mine.
+
+    The counts of all cells are added at once with bit-sliced counters: planes[p]
+    holds bit p of every cell's count, so each solution costs a few big-int
+    operations instead of a pass over the board.
+    """
+    planes = []
+    for solution in solutions:
+        carry = solution
+        for p in range(len(planes)):
+            if not carry:
+                break
+            planes[p], carry = planes[p] ^ carry, planes[p] & carry
+        if carry:
+            planes.append(carry)
+
+    # Every plane is spread to one byte per cell, so eight of them add up in a single
+    # big int whose bytes are the counts (at most 255, nothing carries between cells)
+    counts = [0] * cells
+    for low in range(0, len(planes), 8):
+        total = 0
+        for p, plane in enumerate(planes[low:low + 8]):
+            bits = format(plane, f"0{cells}b").encode().translate(_BIT_BYTES)
+            total += int.from_bytes(bits, "big") << p
+        digits = total.to_bytes(cells, "big")[::-1]
+        counts = [count | digit << low for count, digit in zip(counts, digits)] \
+            if low else list(digits)
+    return counts
+
+
+# ------------- NO-GUESS GENERATION ---------------- #
+
+def reveal_region(truth: List[List[int]], game: List[List[int]],
+                  i: int, j: int, shown: List[List[bool]] = None) -> List[Tuple[int, int]]:
+    """
+    Reveals (i, j) on game from truth and opens the whole connected region of blanks
+    around it, using a queue instead of recursion. Returns the newly revealed cells,
+    as one batch for the caller to redraw or hand to SolverSession.update().
+
+    With a shown grid of booleans, that grid (updated in place) decides which cells
+    are still hidden instead of game's UNKNOWN cells, and game may be None.
+    """
+    rows = len(truth)
+    cols = len(truth[0])
+    # mask tells hidden cells apart: game's UNKNOWN cells, or shown's False ones
+    mask, hidden = (game, UNKNOWN) if shown is None else (shown, False)
+
+    if mask[i][j] != hidden:
+        return []
+    mask[i][j] = truth[i][j] if shown is None else True
+    revealed = [(i, j)]
+    queue = deque(revealed)
+    while queue:
+        r, c = queue.popleft()
+        if truth[r][c] != 0:
+            continue
+        # neighbors() inlined, this loop runs once per cell of the region
+        for nr in range(max(r - 1, 0), min(r + 2, rows)):
+            row = mask[nr]
+            for nc in range(max(c - 1, 0), min(c + 2, cols)):
+                if row[nc] == hidden:
+                    row[nc] = truth[nr][nc] if shown is None else True
+                    revealed.append((nr, nc))
+                    queue.append((nr, nc))
+    if shown is not None and game is not None:
+        for r, c in revealed:
+            game[r][c] = truth[r][c]
+    return revealed
+
+
+class _FrontierState:
+    """
+    frontier_constraints() of a game that starts fully hidden, kept up to date as
+    cells are revealed and flagged instead of split from the whole board again.
+    Only the numbers around the changed cells are looked at, and only their
+    constraints are checked by settled().
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        # number cell -> [its unknown neighbors, mines still needed among them]
+        self.cons = {}
+        # unknown cell -> the number cells whose constraint holds it
+        self.cover = {}
+        self.interior = {(i, j) for i in range(rows) for j in range(cols)}
+        self.known_mines = 0
+        # number cells whose constraint changed since the last settled()
+        self.changed = set()
+
+    def _drop(self, cell, is_mine: bool):
+        # takes cell out of every constraint that holds it, and out of the interior
+        for number in self.cover.pop(cell, ()):
+            cells, need = self.cons[number]
+            cells.discard(cell)
+            self.cons[number][1] = need - is_mine
+            self.changed.add(number)
+            if not cells and not self.cons[number][1]:
+                del self.cons[number]
+        self.interior.discard(cell)
+
+    def flag(self, cells):
+        """
+        Records cells as mines
+        """
+        for cell in cells:
+            self._drop(cell, True)
+            self.known_mines += 1
+
+    def reveal(self, game: List[List[int]], cells):
+        """
+        Records cells as revealed on game, adding the constraint of every number
+        """
+        for cell in cells:
+            self._drop(cell, False)
+        for i, j in cells:
+            hidden = set()
+            need = game[i][j]
+            for r, c in neighbors(i, j, self.rows, self.cols):
+                if game[r][c] == MINE:
+                    need -= 1
+                elif game[r][c] == UNKNOWN:
+                    hidden.add((r, c))
+            if hidden or need:
+                self.cons[(i, j)] = [hidden, need]
+                self.changed.add((i, j))
+            for cell in hidden:
+                self.cover.setdefault(cell, set()).add((i, j))
+                self.interior.discard(cell)
+
+    def settled(self):
+        """
+        Returns (safe cells, mine cells) that a changed constraint decides on its own
+        (all of its mines found, or as many mines as cells), or None on a contradiction
+        """
+        decided = {}
+        for number in self.changed:
+            if number not in self.cons:
+                continue
+            cells, need = self.cons[number]
+            if need < 0 or need > len(cells):
+                return None
+            if need == 0 or need == len(cells):
+                for cell in cells:
+                    if decided.setdefault(cell, need > 0) != (need > 0):
+                        return None
+        self.changed.clear()
+        return ({cell for cell, is_mine in decided.items() if not is_mine},
+                {cell for cell, is_mine in decided.items() if is_mine})
+
+    def split(self):
+        """
+        Returns what frontier_constraints(game) would; a number that can no longer be
+        satisfied is left in for propagate() to reject
+        """
+        constraints = [(tuple(sorted(cells)), need)
+                       for _, (cells, need) in sorted(self.cons.items())]
+        return constraints, list(self.interior), self.known_mines
+
+
+def solvable(truth: List[List[int]], first_click: Tuple[int, int], mine_cnt: int) -> bool:
+    """
+    True if the board can be cleared from first_click without guessing.
+
+    Every round reveals everything the numbers next to the last round's cells decide
+    on their own, then everything propagate() can decide; z3 (through certain_cells)
+    is only asked when the local rules get stuck, and the board is rejected as soon
+    as neither finds a new cell. The frontier is kept up to date around the cells
+    each round reveals (see _FrontierState), and the component counts certain_cells()
+    makes are kept across rounds, so only the components those cells touch are swept
+    again.
+    """
+    rows = len(truth)
+    cols = len(truth[0])
+    if truth[first_click[0]][first_click[1]] == MINE:
+        return False
+    game = [[UNKNOWN] * cols for _ in range(rows)]
+    state = _FrontierState(rows, cols)
+    revealed = reveal_region(truth, game, *first_click)
+    state.reveal(game, revealed)
+    hidden_safe = rows * cols - mine_cnt - len(revealed)
+    memo = {}
+
+    while hidden_safe > 0:
+        settled = state.settled()
+        if settled is None:
+            return False
+        safe, mines = settled
+        if not safe and not mines:
+            split = state.split()
+            decided = propagate(game, mine_cnt, True, split)
+            if decided is None:
+                return False
+            safe, mines, _ = decided
+            if not safe and not mines:
+                certain = certain_cells(game, mine_cnt, True, decided=decided,
+                                        split=split, memo=memo)
+                if certain is None:
+                    return False
+                safe, mines = certain
+                if not safe and not mines:
+                    return False
+        for i, j in mines:
+            game[i][j] = MINE
+        state.flag(mines)
+        for i, j in safe:
+            revealed = reveal_region(truth, game, i, j)
+            hidden_safe -= len(revealed)
+            state.reveal(game, revealed)
+    return True
+
+
+def generate_no_guess(rows: int, cols: int, mine_cnt: int,
+                      first_click: Tuple[int, int] = None,
+                      rng: random.Random = None,
+                      max_tries: int = 1000) -> List[List[int]]:
+    """
+    Generates a fully revealed board that can be cleared from first_click (the center
+    by default) using deductions only. The first click and its neighbors never hold a
+    mine, so it always opens a region. Returns None if no board was found in max_tries.
+    """
+    rng = rng or random
+    if first_click is None:
+        first_click = (rows // 2, cols // 2)
+    opening = [first_click] + neighbors(*first_click, rows, cols)
+    exclude = {i * cols + j for i, j in opening}
+    for _ in range(max_tries):
+        truth = truth_board(place_mines(rows, cols, mine_cnt, rng, exclude), rows, cols)
+        if solvable(truth, first_click, mine_cnt):
+            return truth
+    return None
+
+
+def _no_guess_worker(job):
+    rows, cols, mine_cnt, first_click, seed, max_tries = job
+    return generate_no_guess(rows, cols, mine_cnt, first_click,
+                             random.Random(seed), max_tries)
+
+
+def generate_no_guess_many(count: int, rows: int, cols: int, mine_cnt: int,
+                           first_click: Tuple[int, int] = None,
+                           workers: int = None, seed: int = None,
+                           max_tries: int = 1000):
+    """
+    Yields count no-guess boards, searching for candidates in parallel across a
+    process pool. Each board gets its own seed derived from seed.
+    """
+    seeds = random.Random(seed)
+    jobs = ((rows, cols, mine_cnt, first_click, seeds.getrandbits(64), max_tries)
+            for _ in range(count))
+    with multiprocessing.Pool(workers) as pool:
+        for truth in pool.imap_unordered(_no_guess_worker, jobs):
+            if truth is not None:
+                yield truth
+
+
+# ------------- RESULT CACHE ---------------- #
+
+def _to_canonical(i: int, j: int, rows: int, cols: int, sym: int) -> Tuple[int, int]:
+    # sym bit 0 flips rows, bit 1 flips columns, bit 2 transposes (applied in that order)
+    if sym & 1:
+        i = rows - 1 - i
+    if sym & 2:
+        j = cols - 1 - j
+    return (j, i) if sym & 4 else (i, j)
+
+
+def _from_canonical(i: int, j: int, rows: int, cols: int, sym: int) -> Tuple[int, int]:
+    if sym & 4:
+        i, j = j, i
+    if sym & 1:
+        i = rows - 1 - i
+    if sym & 2:
+        j = cols - 1 - j
+    return i, j
+
+
+def transform_board(board: List[List[int]], sym: int) -> List[List[int]]:
+    """
+    Applies one of the 8 dihedral symmetries (0-7) to a board
+    """
+    rows = len(board)
+    cols = len(board[0])
+    shape = (cols, rows) if sym & 4 else (rows, cols)
+    out = [[0] * shape[1] for _ in range(shape[0])]
     for i in range(rows):
         for j in range(cols):
-            if mod.eval(mines[(i, j)]) == 1:
-                board[i][j] = MINE
-            else:
-                board[i][j] = game[i][j]
-    return board
+            ci, cj = _to_canonical(i, j, rows, cols, sym)
+            out[ci][cj] = board[i][j]
+    return out
 
 
+def canonical_board(board: List[List[int]]) -> Tuple[bytes, int]:
+    """
+    Returns (key, sym): the smallest encoding of the board over its 8 dihedral
+    symmetries, and the symmetry that produces it. Rotated and mirrored boards
+    share the same key.
+    """
+    # each symmetry reorders whole rows or columns, so the encodings are built from
+    # byte strings instead of moving the board one cell at a time
+    rows = [bytes(cell + 8 for cell in row) for row in board]
+    cols = [bytes(col) for col in zip(*rows)]
+    best = None
+    for sym in range(8):
+        # a transposed board's rows are the columns, flipped by the other two bits
+        lines, along, across = (cols, 2, 1) if sym & 4 else (rows, 1, 2)
+        if sym & along:
+            lines = lines[::-1]
+        if sym & across:
+            lines = [line[::-1] for line in lines]
+        key = f"{len(lines)}x{len(lines[0])}:".encode() + b"".join(lines)
+        if best is None or key < best[0]:
+            best = (key, sym)
+    return best
+
+
+def _map_result(result, kind: str, rows: int, cols: int, sym: int, to_canonical: bool):
+    # Moves a result between the orientation of the board and its canonical one
+    if result is None or kind == "value":
+        return result
+    canon_shape = (cols, rows) if sym & 4 else (rows, cols)
+    if to_canonical:
+        move, src_cols, dst_shape = _to_canonical, cols, canon_shape
+    else:
+        move, src_cols, dst_shape = _from_canonical, canon_shape[1], (rows, cols)
+
+    if kind == "board":
+        out = [[None] * dst_shape[1] for _ in range(dst_shape[0])]
+        for i, row in enumerate(result):
+            for j, value in enumerate(row):
+                ci, cj = move(i, j, rows, cols, sym)
+                out[ci][cj] = value
+        return out
+    if kind == "cells":
+        return tuple({move(i, j, rows, cols, sym) for i, j in part} for part in result)
+    if kind == "solutions":
+        num_solutions, solutions = result
+        moved = []
+        for solution in solutions:
+            cells = [move(i, j, rows, cols, sym) for i, j in mine_cells(solution, src_cols)]
+            moved.append(sum(1 << (i * dst_shape[1] + j) for i, j in cells))
+        return num_solutions, moved
+    raise ValueError(f"unknown result kind {kind}")
+
+
+_BUDGET_ARGS = ("timeout", "stats", "rlimit", "max_memory", "max_states")
+
+
+class SolverCache:
+    """
+    LRU cache of solver results keyed by the canonical form of the board, so the 8
+    rotations and mirror images of a position share one entry.
+
+    Entries are evicted least-recently-used once their pickled size passes max_bytes.
+    With a path, entries are also written to (and read back from) that directory, so
+    the cache survives across runs and can be shared by worker processes. Budgets
+    (see _BUDGET_ARGS) are left out of the key, so a result found under any budget
+    serves them all.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: str = None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def lookup(self, name: str, fn, game: List[List[int]], *args,
+               kind: str = "value", canonical: Tuple[bytes, int] = None, **kwargs):
+        """
+        Returns fn(game, *args, **kwargs), reusing the result of any symmetric board
+        seen before with the same name and arguments.
+
+        kind says how the result maps between orientations: "value" (unchanged),
+        "board" (a matrix shaped like the board), "cells" (a tuple of cell sets) or
+        "solutions" (solve()'s count and packed solutions). canonical is
+        canonical_board(game), for callers that look up the same board several times.
+        """
+        canonical = canonical or canonical_board(game)
+        found, result = self.get(name, game, *args, kind=kind, canonical=canonical, **kwargs)
+        if found:
+            return result
+        result = fn(game, *args, **kwargs)
+        self.store(name, game, result, *args, kind=kind, canonical=canonical, **kwargs)
+        return result
+
+    def get(self, name: str, game: List[List[int]], *args, kind: str = "value",
+            canonical: Tuple[bytes, int] = None, **kwargs):
+        """
+        Returns (found, result) for the entry lookup() would use, without computing
+        anything on a miss; for callers that produce the result themselves
+        """
+        key, sym = self._key(name, game, args, kwargs, canonical)
+        found, result = self._get(key)
+        if not found:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, _map_result(result, kind, len(game), len(game[0]), sym, to_canonical=False)
+
+    def store(self, name: str, game: List[List[int]], result, *args, kind: str = "value",
+              canonical: Tuple[bytes, int] = None, **kwargs):
+        """
+        Saves result as the entry lookup() would use for these arguments
+        """
+        key, sym = self._key(name, game, args, kwargs, canonical)
+        self._put(key, _map_result(result, kind, len(game), len(game[0]), sym,
+                                   to_canonical=True))
+
+    def discard(self, name: str, game: List[List[int]], *args,
+                canonical: Tuple[bytes, int] = None, **kwargs):
+        """
+        Drops the entry lookup() would use for these arguments, e.g. a partial result
+        """
+        key, _ = self._key(name, game, args, kwargs, canonical)
+        if key in self.entries:
+            self.size -= len(key) + len(self.entries.pop(key))
+        if self.path:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self.path, key + ".pkl"))
+
+    def _key(self, name: str, game: List[List[int]], args, kwargs, canonical=None):
+        board_key, sym = canonical or canonical_board(game)
+        # a budget decides whether a result is found, not what it is
+        options = sorted((k, v) for k, v in kwargs.items() if k not in _BUDGET_ARGS)
+        key = hashlib.sha1(repr((name, args, options)).encode() +
+                           board_key).hexdigest()
+        return key, sym
+
+    def _get(self, key: str):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return True, pickle.loads(self.entries[key])
+        if self.path:
+            try:
+                with open(os.path.join(self.path, key + ".pkl"), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return False, None
+            self._remember(key, data)
+            return True, pickle.loads(data)
+        return False, None
+
+    def _put(self, key: str, result):
+        data = pickle.dumps(result)
+        self._remember(key, data)
+        if self.path:
+            # write then rename so concurrent readers never see a partial file
+            target = os.path.join(self.path, key + ".pkl")
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, target)
+
+    def _remember(self, key: str, data: bytes):
+        if key in self.entries:
+            self.size -= len(key) + len(self.entries.pop(key))
+        if len(data) > self.max_bytes:
+            # too large to keep, and the older entry under key is out of date
+            return
+        self.entries[key] = data
+        self.size += len(key) + len(data)
+        while self.size > self.max_bytes:
+            old_key, old = self.entries.popitem(last=False)
+            self.size -= len(old_key) + len(old)
+
+    def solve(self, game: List[List[int]], *args, stats: SolveStats = None,
+              canonical: Tuple[bytes, int] = None, **kwargs):
+        canonical = canonical or canonical_board(game)
+        found, result = self.get("solve", game, *args, kind="solutions", canonical=canonical,
+                                 **kwargs)
+        if found:
+            return result
+        stats = stats or SolveStats()
+        result = solve(game, *args, stats=stats, **kwargs)
+        if stats.result not in ("timeout", "unknown"):
+            # a solve cut short by its budget must not be served as the answer next time
+            self.store("solve", game, result, *args, kind="solutions", canonical=canonical,
+                       **kwargs)
+        return result
+
+    def mine_probabilities(self, game: List[List[int]], *args, **kwargs):
+        return self.lookup("mine_probabilities", mine_probabilities, game, *args,
+                           kind="board", **kwargs)
+
+    def count_solutions(self, game: List[List[int]], *args, **kwargs):
+        return self.lookup("count_solutions", count_solutions, game, *args, **kwargs)
+
+    def certain_cells(self, game: List[List[int]], *args, **kwargs):
+        return self.lookup("certain_cells", certain_cells, game, *args,
+                           kind="cells", **kwargs)
+
+
+# ------------- BOARD PRINTING ---------------- #
+
 def print_boards(boards: List[List[List[int]]]):
     """
     Prints a list of boards
@@ -248,9 +2897,34 @@ def run(rows=ROWS, cols=COLS, mine_cnt=MINE_CNT, v=VERBOSE):
     board = generate_board(rows, cols, mine_cnt)
     print_board(board)
     num_sols, sols = solve(board, mine_cnt, blanks_no_adj=v)
+    print("exact num_solutions:", count_solutions(board, mine_cnt, blanks_no_adj=v))
 
     print("Solution(s):")
-    print_boards(sols)
+    print_boards([unpack_solution(sol, board) for sol in sols])
+
+
+def run_batch(count, rows=ROWS, cols=COLS, mine_cnt=MINE_CNT, v=VERBOSE,
+              workers=None, timeout=None, ordered=True, seed=None, cache_dir=None,
+              no_guess=False):
+    start = time.perf_counter()
+    if no_guess:
+        truths = generate_no_guess_many(count, rows, cols, mine_cnt,
+                                        workers=workers, seed=seed)
+    else:
+        truths = generate_truths(count, rows, cols, mine_cnt, seed)
+    boards = (mask_board(truth) for truth in truths)
+    # no-guess generation drops the boards that ran out of tries, so count what comes back
+    solved = 0
+    for index, num_sols, _, timed_out in solve_many(boards, workers, timeout, ordered,
+                                                     cache_dir, mine_cnt=mine_cnt,
+                                                     blanks_no_adj=v):
+        solved += 1
+        print(f"board {index}: {num_sols} solution(s)" +
+              (" (timed out)" if timed_out else ""))
+    elapsed = time.perf_counter() - start
+    if solved < count:
+        print(f"{count - solved} of {count} boards could not be generated")
+    print(f"solved {solved} boards in {elapsed:.2f}s ({solved / elapsed:.1f} boards/s)")
 
 
 # if __name__ == "__main__":
@@ -18,6 +18,20 @@ if __name__ == "__main__":
                         help="Number of mines to be included with the minesweeper.")
     parser.add_argument("-t", "--terminal", action='store_true',
                         help="Basic nimsweeper with terminal. This only provides solutions to random boards.")
+    parser.add_argument("-b", "--batch", default=0, type=int,
+                        help="Solve this many random boards in parallel and print each solution count.")
+    parser.add_argument("-w", "--workers", default=None, type=int,
+                        help="Number of worker processes for batch mode (defaults to all cores).")
+    parser.add_argument("--timeout", default=None, type=float,
+                        help="Seconds allowed per board in batch mode.")
+    parser.add_argument("--unordered", action='store_true',
+                        help="Print batch results as they finish instead of in board order.")
+    parser.add_argument("-s", "--seed", default=None, type=int,
+                        help="Seed for the boards generated in batch mode.")
+    parser.add_argument("--cache", default=None,
+                        help="Directory for the on-disk solver cache used in batch mode.")
+    parser.add_argument("--no_guess", action='store_true',
+                        help="Batch mode only generates boards that can be cleared from the center without guessing.")
 
     args = parser.parse_args()
     rows = args.rows
@@ -26,11 +40,16 @@ if __name__ == "__main__":
     mine_count = args.mine_count
     flag = args.terminal
 
-    if flag:
+    if args.batch:
+        print("batch")
+        ns.run_batch(args.batch, rows, cols, mine_count, nv, args.workers,
+                     args.timeout, not args.unordered, args.seed, args.cache,
+                     args.no_guess)
+    elif flag:
         # TODO
         print("terminal")
         ns.run(rows, cols, mine_count, nv)
     else:
         # TODO
         print("visualize")
-        vz.run(mine_count)
+        vz.run(mine_count, rows, cols)
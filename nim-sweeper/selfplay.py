@@ -0,0 +1,236 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from typing import List, Tuple
+
+import nimsweeper as ns
+from engine import GameEngine
+
+
+# ------------------ DEFAULTS -------------------- #
+# Guesses get fixed budgets rather than seconds, so a game plays out the same way
+# however busy the machine is
+GUESS_STATES = 200000  # sweep states a component's exact count may visit (about 2 s)
+GUESS_SAMPLES = 2000  # samples drawn when the exact count runs out of states
+GUESS_DEPTH = 1  # moves best_move_policy() looks ahead
+CHUNK = 50  # games played by a worker per job
+
+
+# -------------- POLICIES ---------------- #
+# A policy looks at the player's view and returns (cells to reveal in order, whether
+# the move is a guess). It gets the game's own rng so every game can be replayed.
+
+def random_policy(game: List[List[int]], mine_cnt: int,
+                  rng: random.Random) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    Reveals a uniformly random unknown cell
+    """
+    unknown = [(i, j) for i, row in enumerate(game) for j, cell in enumerate(row)
+               if cell == ns.UNKNOWN]
+    return [rng.choice(unknown)], True
+
+
+def safe_cells(game: List[List[int]], mine_cnt: int) -> List[Tuple[int, int]]:
+    """
+    Returns the cells that are safe in every solution of the board, sorted: what
+    propagate() proves if anything, else what certain_cells() proves
+    """
+    decided = ns.propagate(game, mine_cnt, constrain_mines=True)
+    if decided is not None and decided[0]:
+        return sorted(decided[0])
+    certain = ns.certain_cells(game, mine_cnt, constrain_mines=True)
+    return [] if certain is None else sorted(certain[0])
+
+
+def guess_probabilities(game: List[List[int]], mine_cnt: int,
+                        rng: random.Random) -> List[List[float]]:
+    """
+    Mine probabilities for choosing a guess: exact unless a component's count needs
+    more than GUESS_STATES states, else estimated from GUESS_SAMPLES samples drawn
+    with rng
+    """
+    try:
+        return ns.mine_probabilities(game, mine_cnt, max_states=GUESS_STATES)
+    except TimeoutError:
+        pass
+    sampled = ns.sample_probabilities(game, mine_cnt, max_samples=GUESS_SAMPLES, rng=rng)
+    return None if sampled is None else sampled[0]
+
+
+def safest_guess(game: List[List[int]], mine_cnt: int,
+                 rng: random.Random) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    Guesses one of the cells most likely to be safe
+    """
+    probs = guess_probabilities(game, mine_cnt, rng)
+    if probs is None:
+        return random_policy(game, mine_cnt, rng)
+    cells, _ = ns.likely_safe_exact(probs, game)
+    return [rng.choice(cells)], True
+
+
+def solver_policy(game: List[List[int]], mine_cnt: int,
+                  rng: random.Random) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    Reveals every cell proven safe; when there are none, guesses one of the cells
+    most likely to be safe
+    """
+    cells = safe_cells(game, mine_cnt)
+    if cells:
+        return cells, False
+    return safest_guess(game, mine_cnt, rng)
+
+
+def best_move_policy(game: List[List[int]], mine_cnt: int,
+                     rng: random.Random) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    Like solver_policy(), but guesses the top cell of a GUESS_DEPTH best_moves() search.
+    The search has no timeout, so it is only run when the position counts within
+    GUESS_STATES (its lookahead positions differ from it by one cell); otherwise it
+    guesses like solver_policy().
+    """
+    cells = safe_cells(game, mine_cnt)
+    if cells:
+        return cells, False
+    try:
+        ns.mine_probabilities(game, mine_cnt, max_states=GUESS_STATES)
+    except TimeoutError:
+        return safest_guess(game, mine_cnt, rng)
+    ranked = ns.best_moves(game, mine_cnt, depth=GUESS_DEPTH, timeout=None)
+    if ranked is None or not ranked[0]:
+        return random_policy(game, mine_cnt, rng)
+    return [ranked[0][0][0]], True
+
+
+POLICIES = {"random": random_policy, "solver": solver_policy, "best": best_move_policy}
+
+
+# -------------- GAMES ---------------- #
+
+def play_game(engine: GameEngine, policy, rng: random.Random,
+              first_click: Tuple[int, int] = None) -> dict:
+    """
+    Plays one game on engine to the end and returns its counters. Mines are placed
+    with rng as generate_board() does, avoiding first_click (if given), which is
+    played first and is not counted as a guess.
+    """
+    mine_cnt = engine.mine_cnt
+    exclude = None
+    if first_click is not None:
+        exclude = {first_click[0] * engine.cols + first_click[1]}
+    engine.new_game(ns.place_mines(engine.rows, engine.cols, mine_cnt, rng, exclude))
+    if first_click is not None:
+        engine.reveal(*first_click)
+
+    guesses = 0
+    moves = 0
+    seconds = 0
+    while not engine.completed:
+        start = time.perf_counter()
+        cells, guess = policy(engine.game, mine_cnt, rng)
+        seconds += time.perf_counter() - start
+        guesses += guess
+        moves += 1
+        for i, j in cells:
+            engine.reveal(i, j)
+            if engine.completed:
+                break
+    return {"win": engine.win, "guesses": guesses, "moves": moves, "policy_seconds": seconds}
+
+
+def _play_worker(job):
+    # Runs in a pool process; each game gets its own rng, so results do not depend
+    # on how the games are split between workers
+    policy, rows, cols, mine_cnt, first_click, seeds = job
+    engine = GameEngine(rows, cols, mine_cnt)
+    totals = {"games": 0, "wins": 0, "guesses": 0, "moves": 0, "policy_seconds": 0}
+    for seed in seeds:
+        result = play_game(engine, POLICIES[policy], random.Random(seed), first_click)
+        totals["games"] += 1
+        totals["wins"] += result["win"]
+        for key in ("guesses", "moves", "policy_seconds"):
+            totals[key] += result[key]
+    return totals
+
+
+def self_play(games: int, rows: int = 9, cols: int = 9, mine_cnt: int = 10,
+              policy: str = "solver", first_click: Tuple[int, int] = None,
+              workers: int = None, seed: int = 0, chunk: int = CHUNK) -> dict:
+    """
+    Plays games with the named policy across a process pool and returns the report:
+    win rate, guesses per game, policy seconds per move and games per second.
+    Game k always gets the same board and random choices for the same seed.
+    """
+    seeds = random.Random(seed)
+    game_seeds = [seeds.getrandbits(64) for _ in range(games)]
+    jobs = [(policy, rows, cols, mine_cnt, first_click, game_seeds[start:start + chunk])
+            for start in range(0, games, chunk)]
+
+    totals = {"games": 0, "wins": 0, "guesses": 0, "moves": 0, "policy_seconds": 0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(_play_worker, jobs):
+            for key in totals:
+                totals[key] += result[key]
+    return report(totals, time.perf_counter() - start, policy, rows, cols, mine_cnt, seed)
+
+
+def report(totals: dict, seconds: float, policy: str, rows: int, cols: int,
+           mine_cnt: int, seed: int) -> dict:
+    games = totals["games"]
+    return dict(
+        totals,
+        policy=policy, rows=rows, cols=cols, mine_cnt=mine_cnt, seed=seed,
+        seconds=seconds,
+        win_rate=totals["wins"] / games if games else 0,
+        guesses_per_game=totals["guesses"] / games if games else 0,
+        seconds_per_move=totals["policy_seconds"] / totals["moves"] if totals["moves"] else 0,
+        games_per_second=games / seconds if seconds else 0,
+    )
+
+
+def print_report(entry: dict):
+    print(f"{entry['policy']:<8} {entry['rows']}x{entry['cols']} {entry['mine_cnt']} mines  "
+          f"{entry['games']:>9} games  win {entry['win_rate']:6.2%}  "
+          f"{entry['guesses_per_game']:5.2f} guesses/game  "
+          f"{entry['seconds_per_move'] * 1000:7.2f} ms/move  "
+          f"{entry['games_per_second']:8.1f} games/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("NIMSWEEPER SELF-PLAY", "Measure how often a policy wins.")
+
+    parser.add_argument("-g", "--games", default=1000, type=int,
+                        help="Number of games per policy.")
+    parser.add_argument("-r", "--rows", default=9, type=int,
+                        help="Number of rows for the game board.")
+    parser.add_argument("-c", "--cols", default=9, type=int,
+                        help="Number of columns for the game board.")
+    parser.add_argument("-m", "--mine_count", default=10, type=int,
+                        help="Number of mines on each board.")
+    parser.add_argument("-p", "--policies", default="solver",
+                        help=f"Comma-separated policies to compare: {', '.join(POLICIES)}.")
+    parser.add_argument("--safe_start", action='store_true',
+                        help="Open every game at the center, which never holds a mine.")
+    parser.add_argument("-w", "--workers", default=None, type=int,
+                        help="Number of worker processes (defaults to all cores).")
+    parser.add_argument("-s", "--seed", default=0, type=int,
+                        help="Seed for the boards; the same seed plays the same games.")
+    parser.add_argument("--chunk", default=CHUNK, type=int,
+                        help="Games per worker job.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the JSON report to this file.")
+
+    args = parser.parse_args()
+    first_click = (args.rows // 2, args.cols // 2) if args.safe_start else None
+    entries = []
+    for name in args.policies.split(","):
+        entry = self_play(args.games, args.rows, args.cols, args.mine_count, name,
+                          first_click, args.workers, args.seed, args.chunk)
+        print_report(entry)
+        entries.append(entry)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": entries}, f, indent=2)
@@ -1,5 +1,5 @@
 import pygame
-import random
+import nimsweeper as ns
 
 # Define constants
 WIDTH, HEIGHT = 400, 400
@@ -24,19 +24,10 @@ revealed = [[False for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
 
 
 def generate_mines():
-    global mines
-    mines = []
-    while len(mines) < MINE_COUNT:
-        x, y = random.randint(
-            0, GRID_WIDTH-1), random.randint(0, GRID_HEIGHT-1)
-        if grid[y][x] != -1:
-            grid[y][x] = -1
-            mines.append((x, y))
-            # increment cell values for adjacent cells
-            for dx in range(-1, 2):
-                for dy in range(-1, 2):
-                    if 0 <= x+dx < GRID_WIDTH and 0 <= y+dy < GRID_HEIGHT and grid[y+dy][x+dx] != -1:
-                        grid[y+dy][x+dx] += 1
+    global mines, grid
+    packed = ns.place_mines(GRID_HEIGHT, GRID_WIDTH, MINE_COUNT)
+    grid = ns.truth_board(packed, GRID_HEIGHT, GRID_WIDTH, mine_value=-1)
+    mines = [(x, y) for y, x in ns.mine_cells(packed, GRID_WIDTH)]
 
     print(mines)
     print(grid)
@@ -50,22 +41,12 @@ def draw_cell(x, y, color):
 
 
 def reveal_cell(x, y):
-    global revealed
-    if revealed[y][x]:
-        return
-    revealed[y][x] = True
-    draw_cell(x, y, BACKGROUND_COLOR)
-    if grid[y][x] == -1:
+    # opens the whole blank region without recursion; the grid is redrawn once afterwards
+    cells = ns.reveal_region(grid, None, y, x, revealed)
+    if cells and grid[y][x] == -1:
         draw_cell(x, y, TEXT_COLOR)
         end_game(False)
-    elif grid[y][x] == 0:
-        for dx in range(-1, 2):
-            for dy in range(-1, 2):
-                if 0 <= x+dx < GRID_WIDTH and 0 <= y+dy < GRID_HEIGHT:
-                    reveal_cell(x+dx, y+dy)
-    else:
-        text = font.render(str(grid[y][x]), True, TEXT_COLOR)
-        screen.blit(text, (x*CELL_SIZE + 4, y*CELL_SIZE + 4))
+    return cells
 
 
 def end_game(win):
@@ -0,0 +1,336 @@
+import itertools
+import os
+import random
+
+import pytest
+
+import corpus
+import nimsweeper as ns
+
+
+# ------------- BRUTE-FORCE REFERENCE ---------------- #
+
+def brute_solutions(game, mine_cnt, blanks_no_adj=False, constrain_mines=True):
+    # every mine placement over the unknown cells that fits the numbers, packed
+    rows = len(game)
+    cols = len(game[0])
+    unknown = [(i, j) for i in range(rows) for j in range(cols) if game[i][j] == ns.UNKNOWN]
+    known = {(i, j) for i in range(rows) for j in range(cols) if game[i][j] == ns.MINE}
+    free = [cell for cell in unknown
+            if not (blanks_no_adj and ns.blank_has_no_info(game, *cell))]
+    found = set()
+    for bits in itertools.product((False, True), repeat=len(free)):
+        mines = known | {cell for cell, bit in zip(free, bits) if bit}
+        if constrain_mines and len(mines) != mine_cnt:
+            continue
+        if all(game[i][j] < 0 or
+               sum(cell in mines for cell in ns.neighbors(i, j, rows, cols)) == game[i][j]
+               for i in range(rows) for j in range(cols)):
+            found.add(sum(1 << (i * cols + j) for i, j in mines))
+    return found
+
+
+def brute_frequencies(solutions, rows, cols):
+    counts = ns.mine_counts(list(solutions), rows * cols)
+    return [[counts[i * cols + j] / len(solutions) for j in range(cols)] for i in range(rows)]
+
+
+def random_position(rng, rows=4, cols=4, mine_cnt=4, reveals=3):
+    # a partly revealed board, with now and then a known mine
+    truth = ns.generate_truth(rows, cols, mine_cnt, rng)
+    game = [[ns.UNKNOWN] * cols for _ in range(rows)]
+    for _ in range(reveals):
+        i, j = rng.randrange(rows), rng.randrange(cols)
+        if truth[i][j] != ns.MINE:
+            game[i][j] = truth[i][j]
+        elif rng.random() < 0.5:
+            game[i][j] = ns.MINE
+    return game
+
+
+def positions(count, seed=0, **kwargs):
+    rng = random.Random(seed)
+    return [random_position(rng, **kwargs) for _ in range(count)]
+
+
+def flat(board):
+    return [value for row in board for value in row]
+
+
+def unknown_cells(game):
+    return [(i, j) for i, row in enumerate(game) for j, value in enumerate(row)
+            if value == ns.UNKNOWN]
+
+
+# ------------- BOARD GENERATION ---------------- #
+
+def test_generate_truths_zero_count():
+    assert ns.generate_truths(0, 9, 9, 10, seed=0) == []
+
+
+def test_generate_truths_matches_truth_board():
+    boards = ns.generate_truths(3, 9, 9, 10, seed=0)
+    assert len(boards) == 3
+    for board in boards:
+        assert sum(row.count(ns.MINE) for row in board) == 10
+        assert board == ns.truth_board(ns.pack_solution(board), 9, 9)
+
+
+def test_neighbor_counts_match_neighbors():
+    rng = random.Random(1)
+    for rows, cols in ((1, 1), (1, 5), (4, 1), (5, 7)):
+        mines = rng.getrandbits(rows * cols)
+        counts = ns.neighbor_counts(mines, rows, cols)
+        for i in range(rows):
+            for j in range(cols):
+                assert counts[i * cols + j] == sum(
+                    mines >> (r * cols + c) & 1 for r, c in ns.neighbors(i, j, rows, cols))
+
+
+# ------------- SOLVING AND COUNTING ---------------- #
+
+@pytest.mark.parametrize("sparse", [True, False])
+@pytest.mark.parametrize("encoding", ["int", "bool"])
+@pytest.mark.parametrize("blanks_no_adj, constrain_mines", [(False, True), (True, False)])
+def test_solve_matches_brute_force(sparse, encoding, blanks_no_adj, constrain_mines):
+    for game in positions(8, rows=3, cols=4, mine_cnt=3):
+        count, solutions = ns.solve(game, 3, blanks_no_adj, constrain_mines, limit_sols=False,
+                                    encoding=encoding, sparse=sparse)
+        expected = brute_solutions(game, 3, blanks_no_adj, constrain_mines)
+        assert count == len(solutions) == len(expected)
+        assert set(solutions) == expected
+
+
+def test_solve_projected_matches_brute_force():
+    for game in positions(10, seed=2):
+        count, configurations = ns.solve_projected(game, 4, False, True, limit_sols=False)
+        assert sum(completions for _, completions in configurations) == \
+            len(brute_solutions(game, 4))
+
+
+@pytest.mark.parametrize("blanks_no_adj, constrain_mines",
+                         [(False, True), (False, False), (True, False)])
+def test_count_solutions_matches_brute_force(blanks_no_adj, constrain_mines):
+    for game in positions(15, seed=3):
+        assert ns.count_solutions(game, 4, blanks_no_adj, constrain_mines) == \
+            len(brute_solutions(game, 4, blanks_no_adj, constrain_mines))
+
+
+@pytest.mark.parametrize("constrain_mines", [True, False])
+def test_mine_probabilities_match_brute_force(constrain_mines):
+    for game in positions(15, seed=4):
+        solutions = brute_solutions(game, 4, constrain_mines=constrain_mines)
+        probs = ns.mine_probabilities(game, 4, constrain_mines=constrain_mines)
+        expected = brute_frequencies(solutions, 4, 4)
+        for i, j in unknown_cells(game):
+            assert probs[i][j] == pytest.approx(expected[i][j])
+
+
+def test_mine_probabilities_without_solution():
+    game = [[1, 1, ns.UNKNOWN],
+            [ns.UNKNOWN, ns.UNKNOWN, ns.UNKNOWN]]
+    assert ns.mine_probabilities(game, 1) is not None
+    game[0][2] = 3
+    assert ns.mine_probabilities(game, 1) is None
+    assert ns.certain_cells(game, 1) is None
+    assert ns.count_solutions(game, 1) == 0
+
+
+@pytest.mark.parametrize("constrain_mines", [True, False])
+def test_certain_cells_match_brute_force(constrain_mines):
+    for game in positions(20, seed=5):
+        solutions = brute_solutions(game, 4, constrain_mines=constrain_mines)
+        expected = brute_frequencies(solutions, 4, 4)
+        safe, mines = ns.certain_cells(game, 4, constrain_mines)
+        unknown = unknown_cells(game)
+        assert set(safe) == {cell for cell in unknown if expected[cell[0]][cell[1]] == 0}
+        assert set(mines) == {cell for cell in unknown if expected[cell[0]][cell[1]] == 1}
+
+
+@pytest.mark.parametrize("constrain_mines", [True, False])
+def test_number_distribution_matches_brute_force(constrain_mines):
+    for game in positions(10, seed=6):
+        solutions = brute_solutions(game, 4, constrain_mines=constrain_mines)
+        for i, j in unknown_cells(game):
+            expected = {}
+            for solution in solutions:
+                if not solution >> (i * 4 + j) & 1:
+                    shown = sum(solution >> (r * 4 + c) & 1 for r, c in ns.neighbors(i, j, 4, 4))
+                    expected[shown] = expected.get(shown, 0) + 1
+            found = ns.number_distribution(game, i, j, 4, constrain_mines)
+            assert {k: v for k, v in found.items() if v} == expected
+
+
+def test_propagate_is_sound():
+    for game in positions(20, seed=7):
+        safe, mines, _ = ns.propagate(game, 4, constrain_mines=True)
+        expected = brute_frequencies(brute_solutions(game, 4), 4, 4)
+        assert all(expected[i][j] == 0 for i, j in safe)
+        assert all(expected[i][j] == 1 for i, j in mines)
+
+
+def test_count_constraints_for_both_encodings():
+    game = positions(1, seed=8)[0]
+    counted = []
+    for encoding in ("int", "bool"):
+        stats = ns.SolveStats()
+        ns.solve(game, 4, encoding=encoding, sparse=False, stats=stats)
+        counted.append(stats.constraints)
+    assert counted[0] == counted[1] > 0
+
+
+# ------------- INCREMENTAL SOLVING ---------------- #
+
+def test_session_matches_solve_as_cells_are_revealed():
+    rng = random.Random(9)
+    truth = ns.generate_truth(4, 4, 3, rng)
+    game = [[ns.UNKNOWN] * 4 for _ in range(4)]
+    session = ns.SolverSession(4, 4, 3, constrain_mines=True)
+    order = [(i, j) for i in range(4) for j in range(4) if truth[i][j] != ns.MINE]
+    rng.shuffle(order)
+    for step in range(0, 8, 2):
+        cells = []
+        for i, j in order[step:step + 2]:
+            game[i][j] = truth[i][j]
+            cells.append((i, j))
+        _, solutions = session.solve(game, False, limit_sols=False, cells=cells)
+        assert set(solutions) == brute_solutions(game, 3)
+
+
+def test_solve_many_does_not_cache_a_budgeted_partial_result(tmp_path):
+    game = [[ns.UNKNOWN] * 6 for _ in range(6)]
+    game[0][0] = 1
+    expected = ns.count_solutions(game, 6, False, True)
+    kwargs = dict(mine_cnt=6, blanks_no_adj=False, constrain_mines=True, limit_sols=False)
+    (_, partial, _, timed_out), = ns.solve_many([game], 1, cache_dir=str(tmp_path), rlimit=1,
+                                                **kwargs)
+    assert timed_out and partial < expected
+    (_, count, _, timed_out), = ns.solve_many([game], 1, cache_dir=str(tmp_path), **kwargs)
+    assert not timed_out and count == expected
+
+
+# ------------- RESULT CACHE ---------------- #
+
+def test_cache_maps_results_across_symmetries():
+    game = random_position(random.Random(10), rows=3, cols=4, mine_cnt=3, reveals=4)
+    cache = ns.SolverCache()
+    cache.solve(game, 3, False, True, limit_sols=False)
+    cache.mine_probabilities(game, 3)
+    cache.certain_cells(game, 3, True)
+    for sym in range(8):
+        moved = ns.transform_board(game, sym)
+        _, solutions = cache.solve(moved, 3, False, True, limit_sols=False)
+        assert set(solutions) == brute_solutions(moved, 3)
+        assert flat(cache.mine_probabilities(moved, 3)) == \
+            pytest.approx(flat(ns.mine_probabilities(moved, 3)))
+        safe, mines = cache.certain_cells(moved, 3, True)
+        expected_safe, expected_mines = ns.certain_cells(moved, 3, True)
+        assert (set(safe), set(mines)) == (set(expected_safe), set(expected_mines))
+    assert cache.misses == 3 and cache.hits == 24
+
+
+def test_canonical_board_is_shared_by_symmetric_boards():
+    game = random_position(random.Random(11), rows=3, cols=5)
+    key, _ = ns.canonical_board(game)
+    for sym in range(8):
+        assert ns.canonical_board(ns.transform_board(game, sym))[0] == key
+
+
+def test_cache_keys_leave_budgets_out():
+    game = positions(1, seed=12)[0]
+    cache = ns.SolverCache()
+    cache.store("count", game, 7, 4, timeout=1.0)
+    assert cache.get("count", game, 4) == (True, 7)
+    assert cache.get("count", game, 5) == (False, None)
+
+
+# ------------- CORPUS ---------------- #
+
+@pytest.mark.parametrize("kind", [corpus.BOARDS, corpus.STATES, corpus.RESULTS])
+def test_corpus_roundtrip(tmp_path, kind):
+    path = str(tmp_path / "corpus.nswp")
+    rows, cols = 5, 7
+    boards = ns.generate_truths(6, rows, cols, 8, seed=13)
+    if kind != corpus.BOARDS:
+        boards = [[[value if (i + j) % 3 else ns.UNKNOWN for j, value in enumerate(row)]
+                   for i, row in enumerate(board)] for board in boards]
+    probs = [[[(i * cols + j) / (rows * cols) for j in range(cols)] for i in range(rows)]
+             for _ in boards]
+    with corpus.CorpusWriter(path, kind, rows, cols, 8) as writer:
+        if kind == corpus.RESULTS:
+            writer.write_many(zip(boards, range(len(boards)), probs))
+        else:
+            writer.write_many(boards)
+    with corpus.CorpusReader(path) as reader:
+        assert (reader.kind, reader.rows, reader.cols, reader.mine_cnt) == (kind, rows, cols, 8)
+        assert list(reader) == boards
+        if kind == corpus.RESULTS:
+            board, solutions, read_probs = reader.result(3)
+            assert board == boards[3] and solutions == 3
+            assert flat(read_probs) == pytest.approx(flat(probs[3]), abs=1 / 255)
+
+
+def test_corpus_ignores_and_drops_a_truncated_tail(tmp_path):
+    path = str(tmp_path / "corpus.nswp")
+    boards = ns.generate_truths(4, 3, 3, 2, seed=14)
+    with corpus.CorpusWriter(path, corpus.BOARDS, 3, 3, 2) as writer:
+        writer.write_many(boards[:3])
+    # an interrupted writer leaves part of a record behind
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02")
+    with corpus.CorpusReader(path) as reader:
+        assert list(reader) == boards[:3]
+    with corpus.CorpusWriter(path, corpus.BOARDS, 3, 3, 2) as writer:
+        writer.write(boards[3])
+    assert os.path.getsize(path) == corpus.HEADER_SIZE + 4 * corpus.record_size(
+        corpus.BOARDS, 3, 3)
+    with corpus.CorpusReader(path) as reader:
+        assert list(reader) == boards
+
+
+def test_corpus_results_need_probabilities(tmp_path):
+    path = str(tmp_path / "corpus.nswp")
+    board = ns.generate_truth(3, 3, 2, random.Random(15))
+    with corpus.CorpusWriter(path, corpus.RESULTS, 3, 3, 2) as writer:
+        with pytest.raises(ValueError):
+            writer.write(board, 1)
+
+
+# ------------- NO-GUESS BOARDS ---------------- #
+
+def brute_solvable(truth, first_click, mine_cnt):
+    # reveals every cell that is safe in all solutions until none is left
+    rows = len(truth)
+    cols = len(truth[0])
+    game = [[ns.UNKNOWN] * cols for _ in range(rows)]
+    if truth[first_click[0]][first_click[1]] == ns.MINE:
+        return False
+    ns.reveal_region(truth, game, *first_click)
+    while True:
+        probs = brute_frequencies(brute_solutions(game, mine_cnt), rows, cols)
+        safe = [(i, j) for i, j in unknown_cells(game) if probs[i][j] == 0]
+        if not safe:
+            return all(truth[i][j] == ns.MINE for i, j in unknown_cells(game))
+        for i, j in safe:
+            ns.reveal_region(truth, game, i, j)
+
+
+def test_solvable_matches_brute_force():
+    rng = random.Random(16)
+    results = []
+    for _ in range(40):
+        truth = ns.generate_truth(4, 4, 4, rng)
+        first_click = (rng.randrange(4), rng.randrange(4))
+        results.append(ns.solvable(truth, first_click, 4))
+        assert results[-1] == brute_solvable(truth, first_click, 4)
+    assert any(results) and not all(results)
+
+
+def test_generate_no_guess():
+    rng = random.Random(17)
+    for _ in range(3):
+        truth = ns.generate_no_guess(9, 9, 10, rng=rng)
+        assert sum(row.count(ns.MINE) for row in truth) == 10
+        assert all(truth[i][j] != ns.MINE for i, j in [(4, 4)] + ns.neighbors(4, 4, 9, 9))
+        assert ns.solvable(truth, (4, 4), 10)
+        assert truth == ns.truth_board(ns.pack_solution(truth), 9, 9)
@@ -1,13 +1,19 @@
+import threading
+
 import pygame
 import nimsweeper as ns
-import random
+from engine import GameEngine, CONFIRMED_FLAG, FLAG, NO_MARK
 
 # Define dimensions
-WINDOW_WIDTH = 500
+WINDOW_WIDTH = 500  # smallest window, wide enough for the buttons
 WINDOW_HEIGHT = 550
+BUTTON_HEIGHT = 50
+MAX_VIEW_WIDTH = 1200  # boards larger than the view scroll inside it
+MAX_VIEW_HEIGHT = 800
 CELL_SIZE = 50
-BOARD_WIDTH = 10
-BOARD_HEIGHT = 10
+ZOOM_LEVELS = (4, 6, 8, 12, 16, 20, 25, 35, 50, 70)  # cell sizes in pixels
+SCROLL_STEP = 60  # pixels per arrow key press or wheel notch
+MIN_TEXT_SIZE = 12  # smaller cells show numbers as colored squares
 
 NUMBER_COLORS = {
     1: (0, 0, 255),  # blue
@@ -24,39 +30,68 @@ SAFE = 0
 UNKNOWN = -1
 MINE = -4
 
+SOLVE_BUDGET = 2.0  # seconds a solve may spend enumerating (building included) or on probabilities
+MOVE_BUDGET = 0.5  # seconds spent searching for the best move once a guess is needed
+MOVE_DEPTH = 2
+FPS = 60
+IDLE_WAIT_MS = 100  # longest the loop sleeps waiting for input when nothing is solving
+PROGRESS_EVERY = 10  # solutions between progressive hint updates
+# solves skip enumerating solutions once the frontier has more cells than this
+ENUMERATE_MAX_CELLS = 900
+
+# posted by the background solver, tagged with the job they belong to
+SOLVE_PROGRESS = pygame.USEREVENT + 1
+SOLVE_DONE = pygame.USEREVENT + 2
+
 
 class Visualize:
-    def __init__(self, mine_count):
+    def __init__(self, mine_count, rows=ns.ROWS, cols=ns.COLS):
         # Initialize pygame
-        self.rows = ns.ROWS
-        self.cols = ns.COLS
+        self.rows = rows
+        self.cols = cols
         self.mine_count = mine_count
 
-        self.game = [[-1 for _ in range(self.cols)] for _ in range(self.rows)]
-        self.completed = False
-        self.revealed = [[False for _ in range(
-            self.cols)] for _ in range(self.rows)]
+        # the rules and the board state, the window only draws and drives them
+        self.engine = GameEngine(rows, cols, mine_count, mine_value=MINE)
         self.likely_mines = [[False for _ in range(
             self.cols)] for _ in range(self.rows)]
         self.likely_safe = [[False for _ in range(
             self.cols)] for _ in range(self.rows)]
-        self.flags = [[False for _ in range(
-            self.cols)] for _ in range(self.rows)]
-        self.confirmed_flags = [
-            [False for _ in range(self.cols)] for _ in range(self.rows)]
+        # the cells the last solve event marked, the only ones the next one clears
+        self.hinted = []
         self.running = True
-        self.win = False
         self.switch = False  # True for game-design mode
-        self.truth = [[0 for _ in range(self.cols)]
-                      for _ in range(self.rows)]
-
-        self._generate_board()
 
-        self.WINDOW_WIDTH = WINDOW_WIDTH
-        self.WINDOW_HEIGHT = WINDOW_HEIGHT
-        self.CELL_SIZE = CELL_SIZE
-        self.BOARD_HEIGHT = BOARD_HEIGHT
-        self.BOARD_WIDTH = BOARD_WIDTH
+        # persistent z3 state, only new reveals get asserted on each solve; made by
+        # the first solve
+        self.session = None
+        # repeated (or mirrored) positions skip the enumeration, probabilities and search
+        self.cache = ns.SolverCache()
+        # positions searched by best_moves(), reused on the later moves of a game
+        self.move_table = {}
+        self.best_move = None
+        # background solving: only the newest job's events are applied, and each
+        # worker waits for the previous one since z3 must not run on two threads
+        self.solve_job = 0
+        self.solve_cancel = threading.Event()
+        self.solve_thread = None
+        self.solve_progress = None
+        # cells revealed since the last solve, asserted on their own by the session;
+        # None after edits it cannot follow (design mode, reset) forces a full update
+        self.pending_cells = None
+        # the batches solves took but did not assert, since the session is only
+        # brought up to date by a solve that enumerates; None for the whole board
+        self.unasserted = None
+
+        self.BOARD_HEIGHT = self.rows
+        self.BOARD_WIDTH = self.cols
+        # the board is seen through a viewport that scrolls and zooms
+        self.VIEW_WIDTH = max(WINDOW_WIDTH, min(self.cols * CELL_SIZE, MAX_VIEW_WIDTH))
+        self.VIEW_HEIGHT = max(WINDOW_HEIGHT - BUTTON_HEIGHT,
+                               min(self.rows * CELL_SIZE, MAX_VIEW_HEIGHT))
+        self.WINDOW_WIDTH = self.VIEW_WIDTH
+        self.WINDOW_HEIGHT = self.VIEW_HEIGHT + BUTTON_HEIGHT
+        self.offset_x, self.offset_y = 0, 0
 
         # Define colors
         self.BLACK = (0, 0, 0)
@@ -71,130 +106,180 @@ class Visualize:
             (self.WINDOW_WIDTH, self.WINDOW_HEIGHT))
         pygame.display.set_caption("Minesweeper Visualizer")
 
-        # Load images
-        self.unknown_image = pygame.image.load("unknown.png").convert_alpha()
-        self.mine_image = pygame.image.load("mine.png").convert_alpha()
-        self.flag_image = pygame.image.load("flag.png").convert_alpha()
-        self.safe_image = pygame.image.load("safe.png").convert_alpha()
-        self.deadly_image = pygame.image.load("deadly.png").convert_alpha()
-        self.flag_confirm_image = pygame.image.load(
-            "flag_confirmed.png").convert_alpha()
-
-        # Resize images to fit the cell size
-        self.unknown_image = pygame.transform.scale(
-            self.unknown_image, (self.CELL_SIZE, self.CELL_SIZE))
-        self.mine_image = pygame.transform.scale(
-            self.mine_image, (self.CELL_SIZE, self.CELL_SIZE))
-        self.flag_image = pygame.transform.scale(
-            self.flag_image, (self.CELL_SIZE, self.CELL_SIZE))
-        self.safe_image = pygame.transform.scale(
-            self.safe_image, (self.CELL_SIZE, self.CELL_SIZE))
-        self.deadly_image = pygame.transform.scale(
-            self.deadly_image, (self.CELL_SIZE, self.CELL_SIZE))
-        self.flag_confirm_image = pygame.transform.scale(
-            self.flag_confirm_image, (self.CELL_SIZE, self.CELL_SIZE))
+        # Load images, scaled copies are made once per zoom level in _set_zoom
+        self.images = {name: pygame.image.load(f"{name}.png").convert_alpha()
+                       for name in ("unknown", "mine", "flag", "safe", "deadly",
+                                    "flag_confirmed")}
+        self.zoom_cache = {}
+
+        # fonts and rendered text are made once, not per cell and frame
+        self.button_font = pygame.font.Font(None, 25)
+        self.gameover_font = pygame.font.Font(None, 50)
+        self.glyphs = {}
+        # what each cell and button was last drawn as, None repaints the whole window
+        self.drawn = None
+
+        # start at the default size, zoomed out until the board fits the view, but
+        # scrolling rather than going below readable numbers
+        fits = [size for size in ZOOM_LEVELS if MIN_TEXT_SIZE <= size <= CELL_SIZE and
+                size * self.cols <= self.VIEW_WIDTH and size * self.rows <= self.VIEW_HEIGHT]
+        self._set_zoom(fits[-1] if fits else MIN_TEXT_SIZE)
 
         self._init_buttons()
         self.cur_safe_pct, self.cur_mine_pct = 0, 0
 
     def draw_board(self):
-        game = self.game
-        self.screen.fill(self.WHITE)
-
-        pct_font = pygame.font.Font(None, self.CELL_SIZE // 2)
-        for i in range(self.BOARD_HEIGHT):
-            for j in range(self.BOARD_WIDTH):
-                # Draw the cell background
-                pygame.draw.rect(self.screen, self.GRAY, (j*self.CELL_SIZE,
-                                                          i*self.CELL_SIZE, self.CELL_SIZE, self.CELL_SIZE))
-
-                # Draw the cell contents
-                if self.completed and self.truth[i][j] == MINE:
-                    self.screen.blit(
-                        self.mine_image, (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                else:
-                    if game[i][j] == MINE:
-                        self.screen.blit(self.mine_image,
-                                         (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                        self.completed = True
-                    elif game[i][j] == UNKNOWN:
-                        self.screen.blit(self.unknown_image,
-                                         (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                    elif game[i][j] == SAFE:
-                        pass
-                    else:
-                        font = pygame.font.Font(None, self.CELL_SIZE)
-                        text = font.render(
-                            str(game[i][j]), True, NUMBER_COLORS[game[i][j]])
-                        text_rect = text.get_rect(
-                            center=(j*self.CELL_SIZE+self.CELL_SIZE/2, i*self.CELL_SIZE+self.CELL_SIZE/2))
-                        self.screen.blit(text, text_rect)
-
-                    if self.likely_safe[i][j]:
-                        self.screen.blit(
-                            self.safe_image, (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                        # TODO: add text for percent likelihood of being safe (cur_safe_pct if nonzero)
-                        if self.cur_safe_pct > 0:
-                            color = (0, 0, 0)
-                            if self.cur_safe_pct < 100:
-                                color = (255, 0, 0)
-                            text_surface = pct_font.render(
-                                "{:.0f}%".format(self.cur_safe_pct), True, color)
-                            text_rect = text_surface.get_rect(center=(
-                                j*self.CELL_SIZE+self.CELL_SIZE//2, i*self.CELL_SIZE+int(self.CELL_SIZE*3/4)))
-                            self.screen.blit(text_surface, text_rect)
-                    if self.likely_mines[i][j]:
-                        self.screen.blit(
-                            self.deadly_image, (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                        # TODO: add text for percent likelihood of being a mine (cur_mine_pct if nonzero)
-                        if self.cur_mine_pct > 0:
-                            color = (0, 0, 0)
-                            if self.cur_mine_pct < 100:
-                                color = (255, 0, 0)
-                            text_surface = pct_font.render(
-                                "{:.0f}%".format(self.cur_mine_pct), True, color)
-                            text_rect = text_surface.get_rect(center=(
-                                j*self.CELL_SIZE+self.CELL_SIZE//2, i*self.CELL_SIZE+int(self.CELL_SIZE*3/4)))
-                            self.screen.blit(text_surface, text_rect)
-
-                    if self.flags[i][j]:
-                        self.screen.blit(
-                            self.flag_image, (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                    elif self.confirmed_flags[i][j]:
-                        self.screen.blit(
-                            self.flag_confirm_image, (j*self.CELL_SIZE, i*self.CELL_SIZE))
-                    else:
-                        pass
-
-            if self.completed:
-                self.draw_gameover()
-
-        # Draw Reset button
-        self.screen.blit(self.reset_button, self.reset_button_rect)
-        font = pygame.font.Font(None, 25)
-        text = font.render("Reset", True, self.WHITE)
-        text_rect = text.get_rect(center=self.reset_button_rect.center)
-        self.screen.blit(text, text_rect)
-
-        # Draw Solve button
-        self.screen.blit(self.solve_button, self.solve_button_rect)
-        text = font.render("Solve", True, self.WHITE)
-        text_rect = text.get_rect(center=self.solve_button_rect.center)
-        self.screen.blit(text, text_rect)
-
-        # Draw Play button
-        self.screen.blit(self.play_button, self.play_button_rect)
-        text = font.render("Play", True, self.WHITE)
-        text_rect = text.get_rect(center=self.play_button_rect.center)
-        self.screen.blit(text, text_rect)
-
-        # Draw Design button
-        self.screen.blit(self.design_button, self.design_button_rect)
-        text = font.render("Design", True, self.WHITE)
-        text_rect = text.get_rect(center=self.design_button_rect.center)
-        self.screen.blit(text, text_rect)
-
-        pygame.display.flip()
+        """
+        Redraws only the cells and buttons whose appearance changed since the last
+        frame and pushes just those rects to the display
+        """
+        full = self.drawn is None
+        if full:
+            self.screen.fill(self.WHITE)
+            self.drawn = {}
+
+        dirty = []
+        rows, cols = self._visible()
+        self.screen.set_clip(pygame.Rect(0, 0, self.VIEW_WIDTH, self.VIEW_HEIGHT))
+        for i in rows:
+            for j in cols:
+                key = self._cell_key(i, j)
+                if self.drawn.get((i, j)) != key:
+                    self.drawn[(i, j)] = key
+                    dirty.append(self._draw_cell(i, j, key).clip(self.screen.get_clip()))
+        self.screen.set_clip(None)
+
+        label = "Solve" if self.solve_progress is None else self.solve_progress
+        for button, rect, text in ((self.reset_button, self.reset_button_rect, "Reset"),
+                                   (self.solve_button, self.solve_button_rect, label),
+                                   (self.play_button, self.play_button_rect, "Play"),
+                                   (self.design_button, self.design_button_rect, "Design")):
+            # buttons are keyed apart from cells, whose (i, j) can equal a button's topleft
+            if self.drawn.get(("button", rect.topleft)) != text:
+                self.drawn[("button", rect.topleft)] = text
+                self.screen.blit(button, rect)
+                glyph = self._glyph(text, self.WHITE, self.button_font)
+                self.screen.blit(glyph, glyph.get_rect(center=rect.center))
+                dirty.append(rect)
+
+        if self.engine.completed and (dirty or self.drawn.get("gameover") != self.engine.win):
+            # cells redrawn this frame may have painted over the banner
+            self.drawn["gameover"] = self.engine.win
+            dirty.append(self.draw_gameover())
+
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+
+    def _visible(self):
+        # the rows and columns at least partly inside the viewport
+        size = self.CELL_SIZE
+        rows = range(self.offset_y // size,
+                     min(self.rows, (self.offset_y + self.VIEW_HEIGHT) // size + 1))
+        cols = range(self.offset_x // size,
+                     min(self.cols, (self.offset_x + self.VIEW_WIDTH) // size + 1))
+        return rows, cols
+
+    def _set_zoom(self, size, anchor=None):
+        """
+        Switches the cell size, keeping the board point under anchor (a window
+        position, the view center by default) in place
+        """
+        ax, ay = anchor or (self.VIEW_WIDTH // 2, self.VIEW_HEIGHT // 2)
+        old = getattr(self, "CELL_SIZE", size)
+        self.CELL_SIZE = size
+        if size not in self.zoom_cache:
+            images = {name: pygame.transform.scale(image, (size, size))
+                      for name, image in self.images.items()}
+            fonts = (pygame.font.Font(None, size), pygame.font.Font(None, max(1, size // 2)))
+            self.zoom_cache[size] = images, fonts
+        images, (self.number_font, self.pct_font) = self.zoom_cache[size]
+        self.unknown_image = images["unknown"]
+        self.mine_image = images["mine"]
+        self.flag_image = images["flag"]
+        self.safe_image = images["safe"]
+        self.deadly_image = images["deadly"]
+        self.flag_confirm_image = images["flag_confirmed"]
+        self._scroll((self.offset_x + ax) * size // old - ax - self.offset_x,
+                     (self.offset_y + ay) * size // old - ay - self.offset_y)
+        self.drawn = None
+
+    def _zoom(self, step, anchor=None):
+        level = ZOOM_LEVELS.index(self.CELL_SIZE) + step
+        if 0 <= level < len(ZOOM_LEVELS):
+            self._set_zoom(ZOOM_LEVELS[level], anchor)
+
+    def _scroll(self, dx, dy):
+        x = min(max(0, self.offset_x + dx), max(0, self.cols * self.CELL_SIZE - self.VIEW_WIDTH))
+        y = min(max(0, self.offset_y + dy), max(0, self.rows * self.CELL_SIZE - self.VIEW_HEIGHT))
+        if (x, y) != (self.offset_x, self.offset_y):
+            self.offset_x, self.offset_y = x, y
+            self.drawn = None
+
+    def _cell_key(self, i, j):
+        # everything that decides how cell (i, j) looks
+        engine = self.engine
+        if engine.completed and engine.truth[i][j] == MINE:
+            return (MINE,)
+        return (engine.game[i][j],
+                self.likely_safe[i][j] and round(self.cur_safe_pct),
+                self.likely_mines[i][j] and round(self.cur_mine_pct),
+                engine.marks[i][j] == FLAG,
+                engine.marks[i][j] == CONFIRMED_FLAG,
+                (i, j) == self.best_move and engine.game[i][j] == UNKNOWN)
+
+    def _draw_cell(self, i, j, key):
+        x, y = j*self.CELL_SIZE - self.offset_x, i*self.CELL_SIZE - self.offset_y
+        rect = pygame.Rect(x, y, self.CELL_SIZE, self.CELL_SIZE)
+        # Draw the cell background
+        pygame.draw.rect(self.screen, self.GRAY, rect)
+
+        # Draw the cell contents
+        if key == (MINE,):
+            self.screen.blit(self.mine_image, (x, y))
+            return rect
+        value, safe_pct, mine_pct, flag, confirmed_flag, best = key
+        if value == MINE:
+            self.screen.blit(self.mine_image, (x, y))
+        elif value == UNKNOWN:
+            self.screen.blit(self.unknown_image, (x, y))
+        elif value != SAFE and self.CELL_SIZE < MIN_TEXT_SIZE:
+            # too small to read, the number's color still shows through
+            pygame.draw.rect(self.screen, NUMBER_COLORS[value], rect.inflate(-2, -2))
+        elif value != SAFE:
+            text = self._glyph(str(value), NUMBER_COLORS[value], self.number_font)
+            self.screen.blit(text, text.get_rect(center=rect.center))
+
+        pct_center = (x + self.CELL_SIZE//2, y + int(self.CELL_SIZE*3/4))
+        show_pct = self.CELL_SIZE >= 2 * MIN_TEXT_SIZE
+        if safe_pct is not False:
+            self.screen.blit(self.safe_image, (x, y))
+            if self.cur_safe_pct > 0 and show_pct:
+                color = (0, 0, 0) if self.cur_safe_pct >= 100 else (255, 0, 0)
+                text = self._glyph("{:.0f}%".format(self.cur_safe_pct), color, self.pct_font)
+                self.screen.blit(text, text.get_rect(center=pct_center))
+        if mine_pct is not False:
+            self.screen.blit(self.deadly_image, (x, y))
+            if self.cur_mine_pct > 0 and show_pct:
+                color = (0, 0, 0) if self.cur_mine_pct >= 100 else (255, 0, 0)
+                text = self._glyph("{:.0f}%".format(self.cur_mine_pct), color, self.pct_font)
+                self.screen.blit(text, text.get_rect(center=pct_center))
+
+        if flag:
+            self.screen.blit(self.flag_image, (x, y))
+        elif confirmed_flag:
+            self.screen.blit(self.flag_confirm_image, (x, y))
+        if best:
+            pygame.draw.rect(self.screen, self.RED, rect, max(1, self.CELL_SIZE // 12))
+        return rect
+
+    def _glyph(self, text, color, font):
+        # rendered text is cached, numbers and percentages repeat across cells and frames
+        key = (text, color, font)
+        if key not in self.glyphs:
+            self.glyphs[key] = font.render(text, True, color)
+        return self.glyphs[key]
 
     def _init_buttons(self):
         # Create Reset button
@@ -222,8 +307,8 @@ class Visualize:
             bottomleft=(self.WINDOW_WIDTH * 0.2, self.WINDOW_HEIGHT))
 
     def draw_gameover(self):
-        gameover_text = pygame.font.Font(None, 50).render(
-            "You Win!" if self.win else "Game Over!", True, self.BLACK)
+        gameover_text = self._glyph("You Win!" if self.engine.win else "Game Over!", self.BLACK,
+                                    self.gameover_font)
         gameover_rect = gameover_text.get_rect(
             center=(self.WINDOW_WIDTH // 2, self.WINDOW_HEIGHT // 2))
         pygame.draw.rect(self.screen, self.WHITE, (
@@ -231,6 +316,7 @@ class Visualize:
         pygame.draw.rect(self.screen, self.BLACK, (
             gameover_rect.left - 10, gameover_rect.top - 10, gameover_rect.width + 20, gameover_rect.height + 20), 5)
         self.screen.blit(gameover_text, gameover_rect)
+        return gameover_rect.inflate(20, 20)
 
     def place_likely(self, likely_mines, likely_safe):
         # for i, j in likely_mines:
@@ -242,7 +328,7 @@ class Visualize:
         # self.draw_board(self.game, self.mines, self.completed)
 
         for i, j in likely_mines:
-            if not self.flags[i][j] and not self.confirmed_flags[i][j]:
+            if not self.engine.marks[i][j]:
                 self.likely_mines[i][j] = True
             # else:
             #     self.flags[i][j] = False
@@ -252,55 +338,57 @@ class Visualize:
             self.likely_safe[i][j] = True
 
     def display(self):
-        # Run the game loop
+        # Run the game loop, capped at FPS frames a second
+        clock = pygame.time.Clock()
         self.draw_board()
         while self.running:
             self.handle_events()
-            if not self.completed:
-                self.draw_board()
-                if not self.switch:
-                    self.check_completed()
-            else:
-                self.draw_board()
-                self.handle_events()
-
-            pygame.display.flip()
+            self.draw_board()
+            if not self.engine.completed and not self.switch:
+                self.engine.check_completed()
+            clock.tick(FPS)
 
         # Quit pygame
         pygame.quit()
 
-    def check_completed(self):
-        win = True
-        for i in range(self.BOARD_HEIGHT):
-            for j in range(self.BOARD_WIDTH):
-                if self.truth[i][j] == MINE:
-                    win = win and (self.flags[i][j]
-                                   or self.confirmed_flags[i][j])
-
-        if win:
-            self.win = win
-            self.completed = True
-
     def handle_events(self):
-        game = self.game
-
-        for event in pygame.event.get():
+        for event in self._next_events():
             if event.type == pygame.QUIT:
                 self.running = False
+                self._cancel_solve()
 
-            if event.type == pygame.MOUSEBUTTONUP:
-                pos = pygame.mouse.get_pos()
-                col = pos[0] // self.CELL_SIZE
-                row = pos[1] // self.CELL_SIZE
+            if event.type in (SOLVE_PROGRESS, SOLVE_DONE) and event.job == self.solve_job:
+                self._handle_solve_event(event)
+
+            if event.type == pygame.KEYDOWN:
+                self._handle_key(event.key)
+
+            if event.type == pygame.MOUSEWHEEL:
+                if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                    self._zoom(1 if event.y > 0 else -1, pygame.mouse.get_pos())
+                elif pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                    self._scroll(-event.y * SCROLL_STEP, 0)
+                else:
+                    self._scroll(-event.x * SCROLL_STEP, -event.y * SCROLL_STEP)
+
+            if event.type == pygame.MOUSEBUTTONUP and event.button in (1, 3):
+                pos = event.pos
+                col = (pos[0] + self.offset_x) // self.CELL_SIZE
+                row = (pos[1] + self.offset_y) // self.CELL_SIZE
+                on_board = (pos[1] < self.VIEW_HEIGHT and
+                            row < self.BOARD_HEIGHT and col < self.BOARD_WIDTH)
 
                 if event.button == 1:  # left-click
                     # Check if Reset button was clicked
                     if self.reset_button_rect.collidepoint(pos):
                         self._handle_reset()
 
-                    # Check if Solve button was clicked
+                    # Check if Solve button was clicked, which cancels a running solve
                     elif self.solve_button_rect.collidepoint(pos):
-                        self._handle_solve()
+                        if self.solve_progress is None:
+                            self._handle_solve()
+                        else:
+                            self._cancel_solve()
 
                     # Check if Switch button was clicked
                     elif self.design_button_rect.collidepoint(pos):
@@ -309,114 +397,265 @@ class Visualize:
                     elif self.play_button_rect.collidepoint(pos):
                         self.switch = False
 
-                    elif row < BOARD_HEIGHT and col < BOARD_WIDTH and not self.completed:
+                    elif on_board and not self.engine.completed:
+                        # the board is about to change, so a running solve is stale
+                        self._cancel_solve()
                         if self.switch:
-                            if self.confirmed_flags[row][col]:
-                                self.confirmed_flags[row][col] = False
+                            self.pending_cells = None
                             if self.likely_mines[row][col]:
                                 self.likely_mines[row][col] = False
                             if self.likely_safe[row][col]:
                                 self.likely_safe[row][col] = False
                             # alternate from values -1 to 8
-                            game[row][col] = ((game[row][col] + 2) % 10) - 1
+                            value = self.engine.game[row][col]
+                            self.engine.set_cell(row, col, ((value + 2) % 10) - 1)
                         else:
-                            if not self.confirmed_flags[row][col]:
+                            if self.engine.marks[row][col] != CONFIRMED_FLAG:
                                 if self.likely_safe[row][col]:
                                     self.likely_safe[row][col] = False
                                 self._handle_play(row, col)
                             else:
                                 pass
 
-                elif event.button == 3:  # right-click
-                    self._handle_right_click(game, row, col)
+                elif event.button == 3 and on_board:  # right-click
+                    self._handle_right_click(row, col)
+
+    def _handle_key(self, key):
+        # arrows scroll the viewport, +/- zoom around its center
+        moves = {pygame.K_LEFT: (-SCROLL_STEP, 0), pygame.K_RIGHT: (SCROLL_STEP, 0),
+                 pygame.K_UP: (0, -SCROLL_STEP), pygame.K_DOWN: (0, SCROLL_STEP)}
+        if key in moves:
+            self._scroll(*moves[key])
+        elif key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            self._zoom(1)
+        elif key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self._zoom(-1)
+
+    def _next_events(self):
+        if self.solve_progress is not None:
+            return pygame.event.get()
+        # nothing animates while idle, so sleep until the next input arrives
+        event = pygame.event.wait(IDLE_WAIT_MS)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
 
     def _handle_reset(self):
-        self.game = [[-1 for _ in range(self.cols)] for _ in range(self.rows)]
-        self.completed = False
-        self.win = False
-        self.revealed = [[False for _ in range(
-            self.cols)] for _ in range(self.rows)]
+        self._cancel_solve()
         self.likely_mines = [[False for _ in range(
             self.cols)] for _ in range(self.rows)]
         self.likely_safe = [[False for _ in range(
             self.cols)] for _ in range(self.rows)]
+        self.hinted = []
+        self.best_move = None
+        self.move_table = {}
         self.running = True
-        self.truth = [[0 for _ in range(self.cols)]
-                      for _ in range(self.rows)]
-        self.flags = [[False for _ in range(
-            self.cols)] for _ in range(self.rows)]
-        self.confirmed_flags = [
-            [False for _ in range(self.cols)] for _ in range(self.rows)]
+        # the session rebuilds itself on the next solve, once it sees the cleared board
+        self.pending_cells = None
+        self.drawn = None  # clears the game-over banner
         if not self.switch:
-            self._generate_board()
+            self.engine.new_game()
         else:
-            self.truth = [[0 for _ in range(self.BOARD_WIDTH)]
-                          for _ in range(self.BOARD_HEIGHT)]
+            self.engine.design()
+
+    def _mine_probabilities(self, game, canonical):
+        # exact when the components can be counted within the budget, otherwise the
+        # best estimate that fits in it
+        try:
+            return self.cache.mine_probabilities(game, self.mine_count, canonical=canonical,
+                                                 timeout=SOLVE_BUDGET / 2)
+        except TimeoutError:
+            pass
+        estimate = ns.anytime_probabilities(game, self.mine_count, timeout=SOLVE_BUDGET / 2)
+        if estimate is None:
+            return None
+        probs, _, _, method = estimate
+        print("probabilities:", method)
+        return probs
 
     def _handle_solve(self):
-        num_sols, sols = ns.solve(self.game,
-                                  blanks_no_adj=False,
-                                  constrain_mines=True,
-                                  limit_sols=True)
-        ns.print_boards(sols)
-        likely_mines, mine_pct = ns.likely_mines(sols)
-        likely_safe, safe_pct = ns.likely_safe(sols, self.game)
-        print("num_solutions", num_sols)
-        # due to non-full sampling, can't be 100% safe
-        self.cur_mine_pct = mine_pct*100 if num_sols >= ns.LIMIT_SOL_SPACE else mine_pct*99
-        self.cur_safe_pct = safe_pct*100
-        self.place_likely(likely_mines, likely_safe)
-
-    def _handle_right_click(self, game, row, col):
-        if self.switch:
-            if self.confirmed_flags[row][col]:
-                self.confirmed_flags[row][col] = False
-
-        if self.flags[row][col]:
-            self.flags[row][col] = False
-        elif game[row][col] == UNKNOWN:
-            self.flags[row][col] = True
-        self.draw_board()
-
-    def _handle_play(self, x, y):
-        if self.truth[x][y] == MINE:
-            self.game[x][y] = self.truth[x][y]
-            self.completed = True
+        """
+        Starts solving a snapshot of the board on a background thread; hints arrive
+        as SOLVE_PROGRESS / SOLVE_DONE events while the window keeps running
+        """
+        self._cancel_solve()
+        self.solve_cancel = threading.Event()
+        self.solve_progress = "..."
+        game = [row[:] for row in self.engine.game]
+        cells, self.pending_cells = self.pending_cells, []
+        self.solve_thread = threading.Thread(
+            target=self._solve_worker,
+            args=(self.solve_job, game, cells, self.solve_cancel, self.solve_thread),
+            daemon=True)
+        self.solve_thread.start()
+
+    def _cancel_solve(self):
+        # events already posted by the old job are ignored once the job number moves on
+        if self.solve_progress is not None:
+            # the job may stop before asserting its batch of revealed cells
+            self.pending_cells = None
+        self.solve_cancel.set()
+        self.solve_job += 1
+        self.solve_progress = None
+
+    def _solve_worker(self, job, game, cells, cancel, previous):
+        if previous is not None:
+            previous.join()
+        if cancel.is_set():
+            return
+        if cells is None or self.unasserted is None:
+            self.unasserted = None
         else:
-            self._reveal(x, y)
-        if all(all(row) for row in self.revealed):
-            self.completed = True
-            self.win = True
+            self.unasserted = self.unasserted + cells
+
+        def post(event_type, **hints):
+            pygame.event.post(pygame.event.Event(event_type, job=job, **hints))
+
+        # local rules decide most positions without reaching z3
+        decided = ns.propagate(game, self.mine_count, constrain_mines=True)
+        if decided is not None and decided[0]:
+            safe, mines, _ = decided
+            print("solved by propagation:", len(safe), "safe,", len(mines), "mines")
+            post(SOLVE_DONE, mines=sorted(mines), safe=sorted(safe),
+                 mine_pct=100 if mines else 0, safe_pct=100)
+            return
 
-    def _reveal(self, x, y):
-        if self.revealed[x][y]:  # If the cell has already been revealed, do nothing
+        # every cache entry below is keyed by the same board, so its key is found once
+        canonical = ns.canonical_board(game)
+        # a position (or a mirror of it) enumerated before skips z3 altogether
+        cached, result = self.cache.get("num_solutions", game, self.mine_count,
+                                        canonical=canonical)
+        if cached:
+            count, exact = result
+            print("num_solutions", count if exact else f"at least {count}", "(cached)")
+        else:
+            frontier = self._frontier_cells(game)
+            if len(frontier) <= ENUMERATE_MAX_CELLS:
+                self._enumerate_solutions(game, frontier, canonical, cancel, post)
+        if cancel.is_set():
             return
 
-        self.revealed[x][y] = True
-        self.game[x][y] = self.truth[x][y]
+        # percentages come from the frontier probabilities, not the first solutions found
+        probs = self._mine_probabilities(game, canonical)
+        if probs is None:
+            print("no solutions for the current board")
+            post(SOLVE_DONE, mines=[], safe=[], mine_pct=0, safe_pct=0)
+            return
+        mines, mine_pct = ns.likely_mines_exact(probs, game)
+        safe, safe_pct = ns.likely_safe_exact(probs, game)
+        best = None
+        if safe_pct < 1 and not cancel.is_set():
+            # a guess is needed, so search for the one most likely to win
+            cached, result = self.cache.get("best_move", game, self.mine_count, kind="cells",
+                                            canonical=canonical)
+            if cached:
+                best = next(iter(result[0]), None)
+            else:
+                ranked = ns.best_moves(game, self.mine_count, depth=MOVE_DEPTH,
+                                       timeout=MOVE_BUDGET, table=self.move_table)
+                if ranked is not None and ranked[0]:
+                    moves, searched = ranked
+                    best = moves[0][0]
+                    print("best move:", best, "win {:.0%}".format(moves[0][1]),
+                          "depth", searched)
+                if not cancel.is_set():
+                    self.cache.store("best_move", game, ({best} if best else set(),),
+                                     self.mine_count, kind="cells", canonical=canonical)
+        post(SOLVE_DONE, mines=mines, safe=safe, mine_pct=mine_pct*100, safe_pct=safe_pct*100,
+             best=best)
+
+    def _frontier_cells(self, game):
+        # the unknown cells next to a number, the variables a sparse solve gives z3
+        split = ns.frontier_constraints(game)
+        if split is None:
+            return []
+        return sorted({cell for cells, _ in split[0] for cell in cells})
+
+    def _enumerate_solutions(self, game, frontier, canonical, cancel, post):
+        # hints refine from the solutions found so far until the exact ones are ready.
+        # They only cover the frontier: counting every cell of a large board per
+        # update would take longer than the solve
+        found_count = 0
+        counts = [0] * len(frontier)
+        positions = [i * self.cols + j for i, j in frontier]
+        # only the cells revealed since the session last caught up reach z3
+        if self.session is None:
+            self.session = ns.SolverSession(self.rows, self.cols, self.mine_count,
+                                            constrain_mines=True)
+            self.unasserted = None
+        self.session.update(game, self.unasserted)
+        self.unasserted = []
+        stats = ns.SolveStats()
+        found = self.session.iter_solutions(game, blanks_no_adj=False, timeout=SOLVE_BUDGET,
+                                            stats=stats, cells=[])
+        try:
+            for sol in found:
+                if cancel.is_set():
+                    return
+                found_count += 1
+                bits = format(sol, f"0{self.rows * self.cols}b")[::-1]
+                for x, position in enumerate(positions):
+                    if bits[position] == "1":
+                        counts[x] += 1
+                if found_count % PROGRESS_EVERY == 0:
+                    post(SOLVE_PROGRESS, count=found_count,
+                         **self._frontier_hints(frontier, counts, found_count))
+                if found_count > ns.SOL_LIMIT:
+                    break
+        finally:
+            found.close()
+        # past SOL_LIMIT or the budget the count is only a lower bound; it is kept all
+        # the same, since it only feeds the printout and the hints always come from the
+        # exact probabilities
+        exact = found_count <= ns.SOL_LIMIT and stats.result not in ("timeout", "unknown")
+        print("num_solutions", found_count if exact else f"at least {found_count}")
+        if not cancel.is_set():
+            self.cache.store("num_solutions", game, (found_count, exact), self.mine_count,
+                             canonical=canonical)
+
+    def _frontier_hints(self, frontier, counts, total):
+        # likely_mines() and likely_safe() over the frontier cells alone
+        top_mine = max(counts, default=0)
+        top_safe = total - min(counts, default=total)
+        mines = [cell for cell, count in zip(frontier, counts) if top_mine and count == top_mine]
+        safe = [cell for cell, count in zip(frontier, counts)
+                if top_safe and total - count == top_safe]
+        return dict(mines=mines, safe=safe,
+                    mine_pct=top_mine / total * 100 if mines else 100,
+                    safe_pct=top_safe / total * 100 if safe else 100)
+
+    def _handle_solve_event(self, event):
+        if event.type == SOLVE_DONE:
+            self.solve_progress = None
+            self.best_move = getattr(event, "best", None)
+        else:
+            self.solve_progress = str(event.count)
+        # progress arrives many times a second, so only the cells it changes are touched
+        for i, j in self.hinted:
+            self.likely_mines[i][j] = False
+            self.likely_safe[i][j] = False
+        self.hinted = event.mines + event.safe
+        self.cur_mine_pct = event.mine_pct
+        self.cur_safe_pct = event.safe_pct
+        self.place_likely(event.mines, event.safe)
+
+    def _handle_right_click(self, row, col):
+        if self.switch and self.engine.marks[row][col] == CONFIRMED_FLAG:
+            self.engine.set_mark(row, col, NO_MARK)
+        self.engine.toggle_flag(row, col)
         self.draw_board()
 
-        if self.truth[x][y] == SAFE:
-            for dx in range(-1, 2):  # if its unknown
-                for dy in range(-1, 2):
-                    if 0 <= x+dx < self.rows and 0 <= y+dy < self.cols:
-                        self._reveal(x+dx, y+dy)
-
-    def _generate_board(self):
-        self.mines = []
-        while len(self.mines) < self.mine_count:
-            x, y = random.randint(
-                0, self.rows-1), random.randint(0, self.cols-1)
-            if self.truth[x][y] != MINE:
-                self.truth[x][y] = MINE
-                self.mines.append((x, y))
-                # increment cell values for adjacent cells
-                for dx in range(-1, 2):
-                    for dy in range(-1, 2):
-                        if 0 <= x+dx < self.rows and 0 <= y+dy < self.cols and self.truth[x+dx][y+dy] != MINE:
-                            self.truth[x+dx][y+dy] += 1
-
-
-def run(mine_count):
-    v = Visualize(mine_count)
+    def _handle_play(self, x, y):
+        """
+        Plays (x, y) and returns the cells it revealed as one batch
+        """
+        # the whole blank region opens in one pass, and the next frame draws it at once
+        cells = self.engine.reveal(x, y)
+        if self.pending_cells is not None:
+            self.pending_cells.extend(cells)
+        return cells
+
+
+def run(mine_count, rows=ns.ROWS, cols=ns.COLS):
+    v = Visualize(mine_count, rows, cols)
     v.display()